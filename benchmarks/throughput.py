@@ -0,0 +1,172 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+import torch
+
+from core.backend_registry import BackendRegistry
+
+HEURISTIC_SCENARIOS = ["transport", "reverse_transport", "wheel"]
+RLLIB_SCENARIOS = BackendRegistry.supported_environments
+MODES = ["base", "robust"]
+
+
+def _run_heuristic(scenario, mode, num_envs, n_agents, n_steps):
+    from environments.base_environment import BaseEnvironment
+    from environments.robust_environment import RobustEnvironment
+    from models.settings import Settings
+
+    settings = Settings(name="benchmark", failure_probability=0.1, seed=0)
+    if mode == "base":
+        environment = BaseEnvironment(scenario, n_agents, {}, settings, n_envs=num_envs, n_steps=n_steps)
+    else:
+        environment = RobustEnvironment(
+            scenario, n_agents, {}, settings, k_robustness=1, n_envs=num_envs, n_steps=n_steps
+        )
+    return {"construction": environment.construction_time, "simulation": environment.total_time}
+
+
+def _run_rollout(scenario, mode, num_envs, n_agents, n_steps):
+    # RLlib scenarios are only rolled out with random actions, training is out of the scope of the benchmark
+    from vmas import make_env
+    from environments.env_parameters import EnvParameters
+
+    init_time = time.time()
+    vmas_env = make_env(
+        scenario=scenario,
+        num_envs=num_envs,
+        device=EnvParameters.DEVICE,
+        continuous_actions=True,
+        max_steps=n_steps,
+        n_agents=n_agents,
+    )
+    if mode == "robust":
+        from rllib.vector_env_wrapper_robust import VectorEnvWrapperRobust
+        env = VectorEnvWrapperRobust(vmas_env, k_robustness=1, failure_probability=0.1)
+    phases = {"construction": time.time() - init_time}
+
+    init_time = time.time()
+    action_sizes = [vmas_env.get_agent_action_size(agent) for agent in vmas_env.agents]
+    if mode == "robust":
+        # Actions come as RLlib hands them to the wrapper, one list of per-agent arrays for each environment
+        env.vector_reset()
+        for _ in range(n_steps):
+            actions = np.random.uniform(-1, 1, (num_envs, len(action_sizes), action_sizes[0])).astype(np.float32)
+            env.vector_step(list(actions))
+    else:
+        vmas_env.reset()
+        for _ in range(n_steps):
+            vmas_env.step([torch.rand(num_envs, action_size) * 2 - 1 for action_size in action_sizes])
+    phases["simulation"] = time.time() - init_time
+    return phases
+
+
+def _run_config(config, results):
+    scenario, mode, num_envs, n_agents, n_steps = config
+    if scenario in RLLIB_SCENARIOS:
+        phases = _run_rollout(scenario, mode, num_envs, n_agents, n_steps)
+    else:
+        phases = _run_heuristic(scenario, mode, num_envs, n_agents, n_steps)
+    results.put({
+        "scenario": scenario,
+        "mode": mode,
+        "num_envs": num_envs,
+        "n_agents": n_agents,
+        "steps": n_steps,
+        "env_steps_per_sec": num_envs * n_steps / phases["simulation"],
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "phases": phases,
+    })
+
+
+def run(args):
+    results = []
+    configs = itertools.product(args.scenarios, args.modes, args.num_envs, args.n_agents, [args.steps])
+    # A fresh process per configuration, so that the peak RSS belongs to that configuration only
+    context = multiprocessing.get_context("spawn")
+    for config in configs:
+        queue = context.Queue()
+        process = context.Process(target=_run_config, args=(config, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"[benchmark] {config} failed with exit code {process.exitcode}")
+            continue
+        result = queue.get()
+        results.append(result)
+        print(
+            f"[benchmark] {result['scenario']} {result['mode']} num_envs={result['num_envs']} "
+            f"n_agents={result['n_agents']}: {result['env_steps_per_sec']:.0f} env-steps/s, "
+            f"{result['peak_rss_mb']:.0f} MB"
+        )
+
+    with open(args.output, 'w') as output_file:
+        json.dump({
+            "host": {
+                "platform": platform.platform(),
+                "python": platform.python_version(),
+                "torch": torch.__version__,
+                "cpu_count": os.cpu_count(),
+            },
+            "results": results,
+        }, output_file, indent=2)
+
+
+def compare(args):
+    def load(path):
+        with open(path, 'r') as results_file:
+            return {
+                (result["scenario"], result["mode"], result["num_envs"], result["n_agents"]): result
+                for result in json.load(results_file)["results"]
+            }
+
+    current, baseline = load(args.results), load(args.baseline)
+    regressions = 0
+    for key, result in current.items():
+        if key not in baseline:
+            continue
+        speed_ratio = result["env_steps_per_sec"] / baseline[key]["env_steps_per_sec"]
+        memory_ratio = result["peak_rss_mb"] / baseline[key]["peak_rss_mb"]
+        regression = speed_ratio < 1 - args.threshold or memory_ratio > 1 + args.threshold
+        regressions += regression
+        print(
+            f"{'REGRESSION' if regression else 'ok':>10} {' '.join(map(str, key))}: "
+            f"{speed_ratio:.2f}x env-steps/s, {memory_ratio:.2f}x peak RSS"
+        )
+    print(f"[benchmark] {regressions} regressions against {args.baseline}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmark of the simulation environments")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Sweep the configurations and save the results")
+    run_parser.add_argument("--scenarios", nargs="+", default=HEURISTIC_SCENARIOS + RLLIB_SCENARIOS)
+    run_parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    run_parser.add_argument("--num-envs", nargs="+", type=int, default=[32, 128, 300])
+    run_parser.add_argument("--n-agents", nargs="+", type=int, default=[2, 4])
+    run_parser.add_argument("--steps", type=int, default=100)
+    run_parser.add_argument("--output", default="benchmark_results.json")
+
+    compare_parser = subparsers.add_parser("compare", help="Flag regressions against a stored baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("--baseline", required=True)
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Tolerated relative slowdown")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import importlib
+
+from core.tracing import tracer
+
+
+class BackendRegistry:
+    # Maps scenarios to the backend that simulates them. Backends are imported the first time a job needs
+    # them, so runs with heuristic scenarios only never load Ray, Tune or wandb.
+    supported_environments = ["balance", "ball_trajectory", "discovery", "dispersion"]  # RLlib scenarios
+    backends = {
+        "rllib_train": ("rllib.rllib_environment", "RLlibEnvironment"),
+        "rllib_experiment": ("rllib.rllib_experiment", "RLlibExperiment"),
+        "rllib_inference": ("rllib.checkpoint_policy", "CheckpointPolicy"),
+    }
+    loaded = {}
+
+    @staticmethod
+    def is_rllib(scenario) -> bool:
+        return scenario in BackendRegistry.supported_environments
+
+    @staticmethod
+    def get_backend_name(scenario, rllib_mode="train") -> str:
+        if not BackendRegistry.is_rllib(scenario):
+            return "vmas"  # Heuristic policies on plain VMAS environments
+        elif rllib_mode == "inference":
+            return "rllib_inference"
+        elif rllib_mode == "train":
+            return "rllib_train"
+        else:
+            raise ValueError(f"Unknown RLlib mode '{rllib_mode}'")
+
+    @staticmethod
+    def register(name, module_name, attribute):
+        BackendRegistry.backends[name] = (module_name, attribute)
+        BackendRegistry.loaded.pop(name, None)
+
+    @staticmethod
+    def load(name):
+        if name not in BackendRegistry.loaded:
+            module_name, attribute = BackendRegistry.backends[name]
+            with tracer.span("backend_import", "setup", backend=name):
+                BackendRegistry.loaded[name] = getattr(importlib.import_module(module_name), attribute)
+        return BackendRegistry.loaded[name]
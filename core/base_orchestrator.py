@@ -1,30 +1,178 @@
 import copy
-import json
+import time
+import traceback
 from abc import ABC
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+import torch
+
+from core.backend_registry import BackendRegistry
+from core.batch_tuner import BatchSizeTuner
+from core.policy_provider import PolicyProvider
+from core.preflight import PreflightPlanner
+from core.result_store import ResultStore
+from core.spec_loader import SpecLoader
+from core.team_formation import TeamFormationSolver
+from core.tracing import tracer
 from environments.base_environment import BaseEnvironment
+from environments.environment_pool import EnvironmentPool
 from environments.robust_environment import RobustEnvironment
-from models.simulation import Simulation
+from models.job import Job, JobResult
+from rllib.policy_store import PolicyStore
+
+
+_worker_env_pool = None
+
+
+def run_job(job: Job, env_pool: EnvironmentPool = None) -> JobResult:
+    with tracer.span("job", "orchestrator", job=job.get_name()):
+        result = _run_environment(job, env_pool)
+    result.phase_histograms.update(tracer.pop_histograms())
+    # Events travel back with the result, so that jobs run by pool workers end up in the same trace
+    result.trace_events = tracer.pop_events()
+    return result
+
+
+def _run_environment(job: Job, env_pool: EnvironmentPool = None) -> JobResult:
+    pool_stats = env_pool.get_stats() if env_pool is not None else {}
+    env_arguments = copy.deepcopy(job.task.env_kwargs)
+    if not _is_robust(job):
+        environment = BaseEnvironment(
+            name=job.task.get_scenario_name(),
+            n_agents=job.n_agents,
+            kwargs=env_arguments,
+            settings=job.settings,
+            env_pool=env_pool,
+            tags=job.get_tags(),
+            n_envs=job.n_envs,
+            checkpoint=job.task.checkpoint,
+        )
+    else:
+        environment = RobustEnvironment(
+            name=job.task.get_scenario_name(),
+            n_agents=job.n_agents,
+            kwargs=env_arguments,
+            settings=job.settings,
+            k_robustness=job.k_robustness,
+            env_pool=env_pool,
+            tags=job.get_tags(),
+            n_envs=job.n_envs,
+            checkpoint=job.task.checkpoint,
+        )
+
+    return JobResult(
+        job_id=job.id,
+        name=job.get_name(),
+        total_reward=environment.total_reward,
+        total_time=environment.total_time,
+        **environment.get_episode_stats(),
+        **environment.get_estimate_stats(),
+        **environment.get_sweep_stats(),
+        phase_histograms=environment.phase_histograms,
+        env_pool_stats={key: value - pool_stats[key] for key, value in env_pool.get_stats().items()}
+        if env_pool is not None else {},
+    )
+
+
+def _is_robust(job: Job) -> bool:
+    # A k=0 team only sees failures when a sweep sets its k_robustness, and RLlib training never sweeps
+    if job.k_robustness > 0:
+        return True
+    backend = BackendRegistry.get_backend_name(job.task.get_scenario_name(), job.settings.rllib_mode)
+    return job.settings.sweep_k_robustness is not None and backend != "rllib_train"
+
+
+def _create_env_pool(settings):
+    return EnvironmentPool(settings.env_pool_memory_mb) if settings.env_pool_memory_mb > 0 else None
+
+
+def _initialize_worker(torch_threads, settings):
+    global _worker_env_pool
+    # Each worker gets a small slice of the cores instead of every worker competing for all of them
+    torch.set_num_threads(torch_threads)
+    tracer.enabled = settings.trace_path is not None
+    # Forked workers inherit the events already recorded by the orchestrator
+    tracer.pop_events()
+    tracer.pop_histograms()
+    _worker_env_pool = _create_env_pool(settings)
+
+
+def _run_worker_job(job: Job) -> JobResult:
+    return run_job(job, _worker_env_pool)
 
 
 class BaseOrchestrator(ABC):
 
-    def __init__(self):
+    def __init__(self, spec_cache_dir=".tfm_cache/specs", spec_cache_mb=256.0):
         self.simulation_data = None
+        self.spec_loader = SpecLoader(spec_cache_dir, spec_cache_mb)
+        self.results = []
+        self.env_pool_stats = {}
+        self.trace_events = []
+        self.result_store = None
+        self.duplicate_jobs = {}  # Job id -> jobs with the same result key, which reuse its result
 
     def execute(self, data_path='example/demo.json'):
+        init_time = time.perf_counter()
         self._prepare(data_path)
-        self._check_data()
-        self._run()
+        trace_path = self.simulation_data.settings.trace_path
+        if trace_path is not None:
+            tracer.enabled = True
+            tracer.record("prepare", "orchestrator", init_time, time.perf_counter())
+            tracer.pop_histograms()
+        try:
+            self._check_data()
+            with tracer.span("run", "orchestrator"):
+                self._run()
+            self._report()
+            if trace_path is not None:
+                tracer.export(trace_path, self.trace_events + tracer.pop_events())
+        finally:
+            # Nothing recorded here may leak into the jobs of a later run in the same process
+            tracer.pop_events()
+            tracer.pop_histograms()
+            tracer.enabled = False
+
+    def on_result(self, job, result):
+        if self.result_store is not None and not result.cached:
+            self.result_store.put(ResultStore.get_key(job), job, result)
+        for duplicate_job in self.duplicate_jobs.pop(job.id, []):
+            self.on_result(duplicate_job, result.copy(update=dict(
+                job_id=duplicate_job.id,
+                name=duplicate_job.get_name(),
+                cached=True,
+                env_pool_stats={},
+                phase_histograms={},
+                trace_events=[],
+            )))
+        self.results.append(result)
+        self.trace_events += result.trace_events
+        result.trace_events = []
+        for key, value in result.env_pool_stats.items():
+            self.env_pool_stats[key] = self.env_pool_stats.get(key, 0) + value
+        print(f"[BaseOrchestrator] Job {job.get_name()} finished in {result.total_time}s")
 
-    def on_error(self, error):
-        pass
+    def on_error(self, job, error):
+        print(f"[BaseOrchestrator] Job {job.get_name()} failed, continuing with the remaining jobs")
+        traceback.print_exception(type(error), error, error.__traceback__)
+        for duplicate_job in self.duplicate_jobs.pop(job.id, []):
+            print(f"[BaseOrchestrator] Job {duplicate_job.get_name()} failed as {job.get_name()}")
 
     def _prepare(self, data_path='example/demo.json'):
-        with open(data_path, 'r') as json_file:
-            data_dict = json.load(json_file)
+        self.simulation_data = self.spec_loader.load(data_path)
 
-        self.simulation_data = Simulation(**data_dict)
+        settings = self.simulation_data.settings
+        if settings.generate_teams:
+            solver = TeamFormationSolver(
+                agents=self.simulation_data.agents,
+                max_cost=settings.team_max_cost,
+                max_size=settings.team_max_size,
+                k_robustness=settings.team_k_robustness,
+                top_n=settings.team_top_n,
+            )
+            self.simulation_data.add_teams(solver.solve_all(
+                self.simulation_data.goals, taken_ids=[team.id for team in self.simulation_data.teams]
+            ))
 
     def _check_data(self):
         assert self.simulation_data is not None
@@ -34,33 +182,189 @@ class BaseOrchestrator(ABC):
         assert len(self.simulation_data.teams) > 0
         assert len(self.simulation_data.goals) > 0
 
+        for team in self.simulation_data.teams:
+            if len(team.agents) == 0:
+                raise ValueError(f"Team '{team.id}' has no agents")
+            if team.k_robustness < 0:
+                raise ValueError(f"Team '{team.id}' has a negative k_robustness {team.k_robustness}")
+
         for goal in self.simulation_data.goals:
             assert len(goal.tasks) > 0
             assert len(goal.tasks) > 0
+            for task in goal.tasks:
+                scenario = task.get_scenario_name()
+                if not (BackendRegistry.is_rllib(scenario) or PolicyProvider.has_policy(scenario)):
+                    raise ValueError(f"Goal '{goal.id}' has a task in '{scenario}', a scenario without policy")
 
     def _run(self):
-        for goal in self.simulation_data.goals:
-            for task in goal.tasks:
-                for team in self.simulation_data.teams:
-                    agents = self.simulation_data.get_agents_of_team(team.id)
-                    agents_can_complete_task = [agent for agent in agents if task.can_complete(agent.skills)]
-
-                    env_arguments = copy.deepcopy(task.env_kwargs)
-                    n_agents = len(agents_can_complete_task)
-                    assert n_agents > 0
-
-                    # Revisar porque hay un out of index, quizás debamos probar si cada team puede ejecutar cada tarea en lugar de como está ahorita
-                    if team.k_robustness == 0:
-                        BaseEnvironment(
-                            name=task.get_scenario_name(),
-                            n_agents=n_agents,
-                            kwargs=env_arguments,
-                        )
-                    else:
-                        RobustEnvironment(
-                            name=task.get_scenario_name(),
-                            n_agents=n_agents,
-                            kwargs=env_arguments,
-                            settings=self.simulation_data.settings,
-                            k_robustness=team.k_robustness
-                        )
+        jobs = self._schedule(self._build_jobs())
+        # Before any job runs, so that the RLlib results are stored and reused as well
+        jobs = self._use_stored_results(jobs)
+        jobs = self._run_rllib_experiment(jobs)
+        if self.simulation_data.settings.workers > 1:
+            self._run_parallel(jobs)
+        else:
+            self._run_sequential(jobs)
+
+    def _run_rllib_experiment(self, jobs):
+        # Trains the policies of all the RLlib jobs as one Tune experiment, returns the jobs left to run
+        settings = self.simulation_data.settings
+        if settings.rllib_mode != "train" or not settings.rllib_concurrent_trials:
+            return jobs
+        rllib_jobs = [job for job in jobs if BackendRegistry.is_rllib(job.task.get_scenario_name())]
+        if len(rllib_jobs) == 0:
+            return jobs
+
+        RLlibEnvironment = BackendRegistry.load("rllib_train")
+        RLlibExperiment = BackendRegistry.load("rllib_experiment")
+
+        policy_store = PolicyStore(settings.policy_store_dir) if settings.policy_store_dir is not None else None
+        experiment = RLlibExperiment(settings.name, {
+            job.id: RLlibEnvironment(
+                job.task.get_scenario_name(),
+                job.n_agents,
+                job.k_robustness,
+                settings.failure_probability if job.k_robustness > 0 else 0.0,
+                num_vectorized_envs=settings.rllib_num_envs_per_worker,
+                num_workers=settings.rllib_num_workers,
+                policy_store=policy_store,
+                warm_start_iterations=settings.warm_start_iterations,
+                render_stride=settings.render_stride,
+                auto_train=False,
+            )
+            for job in rllib_jobs
+        })
+        try:
+            with tracer.span("rllib_experiment", "orchestrator", trials=len(rllib_jobs)):
+                results = experiment.run()
+        except Exception as error:
+            for job in rllib_jobs:
+                self.on_error(job, error)
+        else:
+            for job in rllib_jobs:
+                result = results.get(job.id, {})
+                if "error" in result:
+                    self.on_error(job, RuntimeError(result["error"]))
+                    continue
+                self.on_result(job, JobResult(
+                    job_id=job.id,
+                    name=job.get_name(),
+                    total_reward=result.get("total_reward"),
+                    total_time=result.get("total_time"),
+                ))
+        return [job for job in jobs if job not in rllib_jobs]
+
+    def _use_stored_results(self, jobs):
+        # Returns the jobs left to run: one per result key that has no stored result
+        settings = self.simulation_data.settings
+        if settings.result_cache_dir is None:
+            return jobs
+        self.result_store = ResultStore(settings.result_cache_dir, persistent=settings.seed is not None)
+        if not self.result_store.persistent:
+            print("[BaseOrchestrator] No seed set, results are not stored or reused across runs")
+
+        jobs_to_run = {}
+        for job in jobs:
+            key = ResultStore.get_key(job)
+            if key in jobs_to_run:
+                self.result_store.duplicates += 1
+                self.duplicate_jobs.setdefault(jobs_to_run[key].id, []).append(job)
+                continue
+            result = self.result_store.get(key, job)
+            if result is not None:
+                self.on_result(job, result)
+            else:
+                jobs_to_run[key] = job
+        return list(jobs_to_run.values())
+
+    def _build_jobs(self):
+        settings = self.simulation_data.settings
+        tuner = None
+        if settings.auto_tune_num_envs:
+            tuner = BatchSizeTuner(
+                memory_ceiling_mb=settings.tuning_memory_ceiling_mb,
+                probe_steps=settings.tuning_probe_steps,
+                torch_threads=settings.torch_threads_per_worker,
+            )
+
+        # Team/task combinations without any able agent are pruned here instead of failing inside a worker
+        planner = PreflightPlanner(self.simulation_data)
+        planner.print_report()
+
+        jobs = []
+        for goal, task_index, task, team, agents_can_complete_task in planner.get_plan():
+            n_agents = len(agents_can_complete_task)
+            jobs.append(Job(
+                id=len(jobs),
+                goal_id=goal.id,
+                task_index=task_index,
+                task=task,
+                team_id=team.id,
+                n_agents=n_agents,
+                agent_skills=[agent.skills for agent in agents_can_complete_task],
+                k_robustness=team.k_robustness,
+                # RLlib jobs keep their own batch size, the tuned one fits the heuristic rollouts
+                n_envs=tuner.get_num_envs(task.get_scenario_name(), n_agents, task.env_kwargs)
+                if tuner is not None and not BackendRegistry.is_rllib(task.get_scenario_name()) else None,
+                settings=settings,
+            ))
+        if len(jobs) == 0:
+            raise ValueError("No team has an agent able to do any task of the goals")
+        return jobs
+
+    def _schedule(self, jobs):
+        schedule_order = self.simulation_data.settings.schedule_order
+        if schedule_order == "longest_first":
+            # RLlib jobs train a policy, which takes far longer than any heuristic rollout
+            return sorted(
+                jobs,
+                key=lambda job: (BackendRegistry.is_rllib(job.task.get_scenario_name()), job.n_agents),
+                reverse=True,
+            )
+        elif schedule_order == "by_scenario":
+            return sorted(jobs, key=lambda job: job.task.get_scenario_name())
+        elif schedule_order == "default":
+            return jobs
+        else:
+            raise ValueError(f"Unknown schedule order '{schedule_order}'")
+
+    def _report(self):
+        if self.result_store is not None:
+            stats = self.result_store.get_stats()
+            print(
+                f"[BaseOrchestrator] Result store: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['duplicates']} duplicate jobs reused"
+            )
+        if self.env_pool_stats:
+            print(
+                f"[BaseOrchestrator] Environment pool: {self.env_pool_stats['hits']} hits, "
+                f"{self.env_pool_stats['misses']} misses, {self.env_pool_stats['evictions']} evictions, "
+                f"{self.env_pool_stats['construction_time_saved']:.2f}s of construction saved"
+            )
+
+    def _run_sequential(self, jobs):
+        env_pool = _create_env_pool(self.simulation_data.settings)
+        for job in jobs:
+            try:
+                result = run_job(job, env_pool)
+            except Exception as error:
+                self.on_error(job, error)
+            else:
+                self.on_result(job, result)
+
+    def _run_parallel(self, jobs):
+        settings = self.simulation_data.settings
+        with ProcessPoolExecutor(
+                max_workers=settings.workers,
+                initializer=_initialize_worker,
+                initargs=(settings.torch_threads_per_worker, settings),
+        ) as executor:
+            futures = {executor.submit(_run_worker_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    result = future.result()
+                except Exception as error:
+                    self.on_error(job, error)
+                else:
+                    self.on_result(job, result)
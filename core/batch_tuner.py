@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import time
+
+import torch
+from vmas import make_env
+
+from environments.base_environment import BaseEnvironment
+from environments.env_parameters import EnvParameters
+from environments.environment_pool import estimate_env_memory
+
+
+class BatchSizeTuner:
+    # Picks, per (scenario, n_agents), the num_envs with the most env-steps/sec that fits under a memory ceiling
+    def __init__(
+            self,
+            cache_path=".tfm_cache/num_envs.json",
+            memory_ceiling_mb=2048.0,
+            probe_steps=20,
+            candidates=(16, 32, 64, 128, 256, 512, 1024, 2048),
+            n_steps=EnvParameters.NUM_STEPS,
+            torch_threads=1,
+    ):
+        self.cache_path = cache_path
+        self.memory_ceiling = memory_ceiling_mb * 1024 * 1024
+        self.probe_steps = probe_steps
+        self.candidates = candidates
+        self.n_steps = n_steps
+        self.torch_threads = torch_threads  # Threads of the workers that run the jobs
+        self.cache = self._load_cache()
+
+    def get_num_envs(self, scenario, n_agents, env_kwargs=None) -> int:
+        key = self._get_key(scenario, n_agents, env_kwargs or {})
+        if key not in self.cache:
+            # Probe with the thread budget of a worker, the main process may use every core
+            torch_threads = torch.get_num_threads()
+            torch.set_num_threads(self.torch_threads)
+            try:
+                num_envs, env_steps_per_sec = self._probe(scenario, n_agents, env_kwargs or {})
+            finally:
+                torch.set_num_threads(torch_threads)
+            print(f"[BatchSizeTuner] {scenario} with {n_agents} agents: {num_envs} envs, {env_steps_per_sec:.0f} env-steps/s")
+            self.cache[key] = {"num_envs": num_envs, "env_steps_per_sec": env_steps_per_sec}
+            self._save_cache()
+        return self.cache[key]["num_envs"]
+
+    def _get_key(self, scenario, n_agents, env_kwargs):
+        # The best batch size depends on the host as much as on the scenario
+        host = (os.cpu_count(), self.torch_threads, torch.__version__, EnvParameters.DEVICE)
+        config = json.dumps([scenario, n_agents, env_kwargs, host, self.memory_ceiling], sort_keys=True, default=str)
+        return hashlib.sha1(config.encode()).hexdigest()
+
+    def _probe(self, scenario, n_agents, env_kwargs):
+        best_num_envs, best_env_steps_per_sec = self.candidates[0], 0.0
+        for num_envs in self.candidates:
+            env = make_env(
+                scenario=scenario,
+                n_agents=n_agents,
+                num_envs=num_envs,
+                device=EnvParameters.DEVICE,
+                continuous_actions=EnvParameters.CONTINUOUS_ACTIONS,
+                **BaseEnvironment.SCENARIO_KWARGS,
+                **env_kwargs,
+            )
+            # World tensors plus the per-step metrics buffers of a job with this batch size
+            memory = estimate_env_memory(env) + self.n_steps * num_envs * n_agents * 6
+            if memory > self.memory_ceiling:
+                break
+
+            env.reset()
+            actions = [
+                (torch.rand(num_envs, env.get_agent_action_size(agent), device=env.device) * 2 - 1) * agent.u_range
+                for agent in env.agents
+            ]
+            env.step(actions)  # Warm up
+            init_time = time.perf_counter()
+            for _ in range(self.probe_steps):
+                env.step(actions)
+            env_steps_per_sec = num_envs * self.probe_steps / (time.perf_counter() - init_time)
+
+            if env_steps_per_sec > best_env_steps_per_sec:
+                best_num_envs, best_env_steps_per_sec = num_envs, env_steps_per_sec
+            elif env_steps_per_sec < 0.9 * best_env_steps_per_sec:
+                break  # Past the point where bigger batches pay off
+        return best_num_envs, best_env_steps_per_sec
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        with open(self.cache_path, 'r') as cache_file:
+            return json.load(cache_file)
+
+    def _save_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(self.cache_path, 'w') as cache_file:
+            json.dump(self.cache, cache_file, indent=2)
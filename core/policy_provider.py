@@ -1,16 +1,130 @@
-from typing import Type
+import warnings
+from typing import List, Optional, Type
 
+import torch
 from vmas.scenarios.transport import HeuristicPolicy as TransportPolicy, HeuristicPolicy
 from vmas.scenarios.wheel import HeuristicPolicy as WheelPolicy
 
+from core.tracing import tracer
+
+
+class BatchedPolicy:
+    # Computes the actions of all the agents in one call, agents that failed get a zero action
+    def compute_actions(
+            self,
+            observations: List[torch.Tensor],
+            u_ranges: List[float],
+            active_agents: Optional[torch.Tensor] = None,
+    ) -> List[torch.Tensor]:
+        raise NotImplementedError
+
+
+class CompiledPolicy:
+    # compute_action traced with TorchScript. Traces are specialized to the observation shape, so each one is
+    # built once per (scenario, observation shape, u_range) and kept for the whole run.
+    traces = {}
+
+    def __init__(self, scenario, policy: HeuristicPolicy):
+        self.scenario = scenario
+        self.policy = policy
+
+    def compute_action(self, observation: torch.Tensor, u_range) -> torch.Tensor:
+        constant_u_range = not isinstance(u_range, torch.Tensor)
+        key = (self.scenario, tuple(observation.shape), observation.dtype, u_range if constant_u_range else None)
+        if key not in CompiledPolicy.traces:
+            with tracer.span("policy_compile", "setup", scenario=self.scenario), warnings.catch_warnings():
+                warnings.simplefilter("ignore", torch.jit.TracerWarning)
+                if constant_u_range:
+                    CompiledPolicy.traces[key] = torch.jit.trace(
+                        lambda x: self.policy.compute_action(x, u_range=u_range), (observation,), check_trace=False
+                    )
+                else:
+                    CompiledPolicy.traces[key] = torch.jit.trace(
+                        lambda x, u: self.policy.compute_action(x, u_range=u), (observation, u_range), check_trace=False
+                    )
+        if constant_u_range:
+            return CompiledPolicy.traces[key](observation)
+        return CompiledPolicy.traces[key](observation, u_range)
+
+
+class StackedHeuristicPolicy(BatchedPolicy):
+    # For heuristics that compute each row of the batch independently, agents are stacked along the batch
+    def __init__(self, policy: HeuristicPolicy):
+        self.policy = policy
+        # A compiled policy is specialized to one shape, so failed agents are masked instead of left out
+        self.fixed_shape = isinstance(policy, CompiledPolicy)
+
+    def compute_actions(self, observations, u_ranges, active_agents=None):
+        n_agents, num_envs = len(observations), observations[0].shape[0]
+        stacked_observations = torch.cat(observations, dim=0)  # [n_agents * num_envs, obs_size], agent major
+        u_range = self._get_u_range(u_ranges, num_envs, stacked_observations.device)
+
+        if active_agents is None or self.fixed_shape:
+            actions = self.policy.compute_action(stacked_observations, u_range=u_range)
+            actions = actions.view(n_agents, num_envs, -1)
+            if active_agents is not None:
+                actions = actions * active_agents.t().unsqueeze(-1)
+            return list(actions.unbind(0))
+
+        index = torch.nonzero(active_agents.t().reshape(-1)).squeeze(-1)
+        active_actions = self.policy.compute_action(
+            stacked_observations[index],
+            u_range=u_range if isinstance(u_range, float) else u_range[index],
+        )
+        actions = stacked_observations.new_zeros(n_agents * num_envs, active_actions.shape[-1])
+        actions[index] = active_actions
+        return list(actions.view(n_agents, num_envs, -1).unbind(0))
+
+    @staticmethod
+    def _get_u_range(u_ranges, num_envs, device):
+        if len(set(u_ranges)) == 1:
+            return float(u_ranges[0])
+        return torch.tensor(u_ranges, device=device).repeat_interleave(num_envs).unsqueeze(-1)
+
+
+class PerAgentPolicy(BatchedPolicy):
+    # Fallback for heuristics that need the whole batch of a single agent
+    def __init__(self, policy: HeuristicPolicy):
+        self.policy = policy
+
+    def compute_actions(self, observations, u_ranges, active_agents=None):
+        actions = []
+        for i, observation in enumerate(observations):
+            action = self.policy.compute_action(observation, u_range=u_ranges[i])
+            if active_agents is not None:
+                action = action * active_agents[:, i].unsqueeze(-1)
+            actions.append(action)
+        return actions
+
 
 class PolicyProvider:
+    policies = {}  # Scenario -> (heuristic policy, whether its rows can be stacked)
+
+    @staticmethod
+    def register(scenario, policy: Type[HeuristicPolicy], stackable=False):
+        PolicyProvider.policies[scenario] = (policy, stackable)
+
+    @staticmethod
+    def has_policy(scenario) -> bool:
+        return scenario in PolicyProvider.policies
 
     @staticmethod
     def get_policy_for(environment) -> Type[HeuristicPolicy]:
-        if environment == "transport" or environment == "reverse_transport":
-            return TransportPolicy
-        elif environment == "wheel":
-            return WheelPolicy
+        if environment not in PolicyProvider.policies:
+            raise ValueError(f"No policy registered for scenario '{environment}'")
+        return PolicyProvider.policies[environment][0]
+
+    @staticmethod
+    def get_batched_policy_for(environment, continuous_action, compiled=False) -> BatchedPolicy:
+        policy = PolicyProvider.get_policy_for(environment)(continuous_action=continuous_action)
+        if compiled:
+            policy = CompiledPolicy(environment, policy)
+        if PolicyProvider.policies[environment][1]:
+            return StackedHeuristicPolicy(policy)
         else:
-            return None  # TODO: raise exception
+            return PerAgentPolicy(policy)
+
+
+PolicyProvider.register("transport", TransportPolicy, stackable=True)
+PolicyProvider.register("reverse_transport", TransportPolicy, stackable=True)
+PolicyProvider.register("wheel", WheelPolicy, stackable=True)
@@ -0,0 +1,128 @@
+import numpy as np
+
+from models.simulation import Simulation
+
+
+class PreflightPlanner:
+    # Checks every goal × task × team combination with a few array operations before any environment is built.
+    # Teams are kept as flat member slots instead of a dense [team, agent] matrix, and only the skills that a task
+    # needs are looked at, so memory grows with the team sizes and not with the product of the catalog sizes:
+    #   member_team, member_agent [slot]: team and agent of every member of every team, in team order
+    #   member_eligible [slot, task skill]: whether the member has the skill
+    #   eligible [team, task]: members of the team able to do the task
+    def __init__(self, simulation: Simulation):
+        self.simulation = simulation
+        agents, teams, goals = simulation.agents, simulation.teams, simulation.goals
+        self.tasks = [
+            (goal_index, task_index, task)
+            for goal_index, goal in enumerate(goals)
+            for task_index, task in enumerate(goal.tasks)
+        ]
+        task_skills = sorted({task.environment for _, _, task in self.tasks})
+        skill_indexes = {skill: i for i, skill in enumerate(task_skills)}
+        agent_indexes = {agent.id: i for i, agent in enumerate(agents)}
+        n_skills = len(task_skills)
+
+        # Built from the skill -> agents index of the simulation, only for the skills that tasks need
+        agent_has_skill = np.zeros((len(agents), n_skills), dtype=bool)
+        for skill, skill_index in skill_indexes.items():
+            skill_agents = [agent_indexes[agent_id] for agent_id in simulation.get_agents_with_skill(skill)]
+            agent_has_skill[skill_agents, skill_index] = True
+
+        team_sizes = np.array([len(team.agents) for team in teams], dtype=np.int64)
+        self.member_team = np.repeat(np.arange(len(teams)), team_sizes)
+        self.member_agent = np.array(
+            [agent_indexes[agent_id] for team in teams for agent_id in team.agents], dtype=np.int64
+        )
+        self.member_eligible = agent_has_skill[self.member_agent]  # [slot, task skill]
+
+        agent_costs = np.array([agent.get_cost() for agent in agents], dtype=np.float64)
+        self.team_costs = np.bincount(self.member_team, weights=agent_costs[self.member_agent], minlength=len(teams))
+        self.k_robustness = np.array([team.k_robustness for team in teams], dtype=np.int64)
+        self.task_skills = np.array([skill_indexes[task.environment] for _, _, task in self.tasks], dtype=np.int64)
+        self.task_goals = np.array([goal_index for goal_index, _, _ in self.tasks], dtype=np.int64)
+
+        slots, skills = np.nonzero(self.member_eligible)
+        eligible = np.bincount(self.member_team[slots] * n_skills + skills, minlength=len(teams) * n_skills)
+        self.eligible = eligible.reshape(len(teams), n_skills)[:, self.task_skills]  # [team, task]
+        # A team stays able to do a task after k_robustness failures while it has k_robustness + 1 eligible agents
+        self.k_slack = self.eligible - (self.k_robustness[:, None] + 1)  # [team, task]
+        # Tasks of a goal are contiguous, so the tasks each team can do are summed per goal in one pass
+        goal_starts = np.searchsorted(self.task_goals, np.arange(len(goals)))
+        covered = np.add.reduceat(self.eligible > 0, goal_starts, axis=1)
+        self.coverage = covered / np.bincount(self.task_goals, minlength=len(goals))  # [team, goal]
+
+    def get_plan(self):
+        # (goal, task index, task, team, eligible agents) of the feasible combinations, task by task with
+        # the cheapest and then most robust teams first
+        team_indexes, task_positions = np.nonzero(self.eligible > 0)
+        order = np.lexsort((
+            -self.k_slack[team_indexes, task_positions],
+            self.team_costs[team_indexes],
+            task_positions,
+        ))
+        team_indexes, task_positions = team_indexes[order], task_positions[order]
+
+        # Eligible member slots of every task skill, grouped by team since the slots are in team order
+        skill_slots = [np.nonzero(self.member_eligible[:, skill])[0] for skill in range(self.member_eligible.shape[1])]
+        skill_starts = [np.searchsorted(self.member_team[slots], team_indexes) for slots in skill_slots]
+
+        agents = self.simulation.agents
+        plan = []
+        for i, (team_index, task_position) in enumerate(zip(team_indexes.tolist(), task_positions.tolist())):
+            goal_index, task_index, task = self.tasks[task_position]
+            skill = self.task_skills[task_position]
+            start = skill_starts[skill][i]
+            slots = skill_slots[skill][start:start + self.eligible[team_index, task_position]]
+            plan.append((
+                self.simulation.goals[goal_index],
+                task_index,
+                task,
+                self.simulation.teams[team_index],
+                [agents[agent_index] for agent_index in self.member_agent[slots].tolist()],
+            ))
+        return plan
+
+    def get_report(self) -> dict:
+        teams, goals = self.simulation.teams, self.simulation.goals
+        infeasible = np.argwhere(self.eligible == 0)
+        not_robust = np.argwhere((self.eligible > 0) & (self.k_slack < 0))
+        return dict(
+            n_jobs=int((self.eligible > 0).sum()),
+            n_pruned=len(infeasible),
+            team_costs={team.id: float(cost) for team, cost in zip(teams, self.team_costs)},
+            goal_coverage={
+                goal.id: {team.id: float(self.coverage[i, j]) for i, team in enumerate(teams)}
+                for j, goal in enumerate(goals)
+            },
+            infeasible=[self._describe(team_index, task_position) for team_index, task_position in infeasible],
+            not_robust=[
+                dict(self._describe(team_index, task_position), k_slack=int(self.k_slack[team_index, task_position]))
+                for team_index, task_position in not_robust
+            ],
+        )
+
+    def print_report(self):
+        report = self.get_report()
+        print(f"[Preflight] {report['n_jobs']} jobs planned, {report['n_pruned']} team/task combinations pruned")
+        for entry in report["infeasible"]:
+            print(f"[Preflight] Team {entry['team']} has no agent for {entry['goal']}/{entry['task']}")
+        for entry in report["not_robust"]:
+            print(
+                f"[Preflight] Team {entry['team']} cannot stay {entry['k_robustness']}-robust on "
+                f"{entry['goal']}/{entry['task']}, {-entry['k_slack']} eligible agents short"
+            )
+        for goal_id, coverage in report["goal_coverage"].items():
+            complete = [team_id for team_id, share in coverage.items() if share == 1]
+            print(f"[Preflight] Goal {goal_id} is fully covered by {len(complete)} of {len(coverage)} teams")
+
+    def _describe(self, team_index, task_position):
+        goal_index, task_index, task = self.tasks[task_position]
+        team = self.simulation.teams[team_index]
+        return dict(
+            goal=self.simulation.goals[goal_index].id,
+            task=task.get_scenario_name(),
+            task_index=task_index,
+            team=team.id,
+            k_robustness=team.k_robustness,
+        )
@@ -0,0 +1,124 @@
+import argparse
+import hashlib
+import json
+import os
+from typing import Optional
+
+from environments.env_parameters import EnvParameters
+from models.job import Job, JobResult
+
+# Bump when a change to the simulation makes the stored results stale
+RESULT_STORE_VERSION = 2
+
+# Settings that change the outcome of a job, the others only change how or where it runs
+SIMULATION_SETTINGS = {
+    "failure_probability",
+    "run_mode",
+    "failure_model",
+    "failure_model_params",
+    "seed",
+    "adaptive_ci_width",
+    "adaptive_metric",
+    "adaptive_confidence",
+    "adaptive_round_envs",
+    "adaptive_max_rounds",
+    "sweep_failure_probabilities",
+    "sweep_k_robustness",
+    "sweep_envs_per_cell",
+    "rllib_mode",
+}
+
+
+class ResultStore:
+    # Job results addressed by a hash of everything the simulation depends on, so that reruns of a simulation
+    # only run the jobs that changed, and jobs that are the same in one run only run once
+    def __init__(self, root=".tfm_cache/results", persistent=True):
+        self.root = root
+        # Results of unseeded runs cannot be reproduced, they are neither reused nor stored
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+        self.duplicates = 0
+
+    @staticmethod
+    def get_key(job: Job) -> str:
+        description = dict(
+            version=RESULT_STORE_VERSION,
+            scenario=job.task.get_scenario_name(),
+            env_kwargs=job.task.env_kwargs,
+            checkpoint=job.task.checkpoint,
+            # Teams with the same agent composition give the same result, whatever their agent ids
+            agent_skills=sorted(sorted(skills) for skills in job.agent_skills),
+            k_robustness=job.k_robustness,
+            n_envs=job.n_envs or EnvParameters.NUM_ENVS,
+            n_steps=EnvParameters.NUM_STEPS,
+            device=EnvParameters.DEVICE,
+            settings=job.settings.dict(include=SIMULATION_SETTINGS),
+        )
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key, job: Job) -> Optional[JobResult]:
+        path = self._get_path(key)
+        if not self.persistent or not os.path.exists(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        with open(path, 'r') as result_file:
+            entry = json.load(result_file)
+        return JobResult(**dict(entry["result"], job_id=job.id, name=job.get_name(), cached=True))
+
+    def put(self, key, job: Job, result: JobResult):
+        if not self.persistent:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        entry = dict(
+            scenario=job.task.get_scenario_name(),
+            team_id=job.team_id,
+            goal_id=job.goal_id,
+            result=result.dict(exclude={"job_id", "name", "cached", "env_pool_stats", "phase_histograms",
+                                        "trace_events"}),
+        )
+        # Written aside and renamed, so that a reader never sees half a file
+        path = self._get_path(key)
+        with open(path + ".tmp", 'w') as result_file:
+            json.dump(entry, result_file)
+        os.replace(path + ".tmp", path)
+
+    def invalidate(self, scenario=None, team_id=None, goal_id=None) -> int:
+        # Removes the entries matching every given field, all of them when none is given
+        if not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        for file_name in os.listdir(self.root):
+            if not file_name.endswith(".json"):
+                continue  # Results still being written
+            path = os.path.join(self.root, file_name)
+            with open(path, 'r') as result_file:
+                entry = json.load(result_file)
+            if (scenario is None or entry["scenario"] == scenario) \
+                    and (team_id is None or entry["team_id"] == team_id) \
+                    and (goal_id is None or entry["goal_id"] == goal_id):
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def get_stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "duplicates": self.duplicates}
+
+    def _get_path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Removes stored job results, so that the jobs run again")
+    parser.add_argument("--root", default=".tfm_cache/results")
+    parser.add_argument("--scenario")
+    parser.add_argument("--team")
+    parser.add_argument("--goal")
+    args = parser.parse_args()
+    removed = ResultStore(args.root).invalidate(args.scenario, args.team, args.goal)
+    print(f"Removed {removed} stored results")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
 import time
-from typing import Type
+from typing import Optional, Type
 
 import torch
 from vmas import make_env
 from vmas.scenarios import discovery
 from vmas.simulator.heuristic_policy import BaseHeuristicPolicy, RandomPolicy
-from vmas.simulator.utils import save_video
+
+from environments.episode_tracker import EpisodeTracker
+from environments.video_recorder import VideoRecorder
 
 
 def run_robustness_tester(
@@ -16,6 +18,10 @@ def run_robustness_tester(
         env_kwargs: dict = {},
         render: bool = False,
         save_render: bool = False,
+        render_stride: int = 1,
+        render_max_resolution: Optional[int] = None,
+        render_env_index: int = 0,
+        run_mode: str = "fixed",
         device: str = "cpu",
 ):
     # Scenario specific variables
@@ -31,7 +37,17 @@ def run_robustness_tester(
         **env_kwargs,
     )
 
-    frame_list = []  # For creating a gif
+    video_recorder = None
+    if render:
+        video_recorder = VideoRecorder(
+            name=scenario_name,
+            fps=1 / env.scenario.world.dt,
+            stride=render_stride,
+            max_resolution=render_max_resolution,
+            env_index=render_env_index,
+            save=save_render,
+        )
+    episodes = EpisodeTracker(n_envs, device)
     init_time = time.time()
     step = 0
     obs = env.reset()
@@ -43,29 +59,31 @@ def run_robustness_tester(
             actions[i] = policy.compute_action(obs[i], u_range=env.agents[i].u_range)
         obs, rews, dones, info = env.step(actions)
         rewards = torch.stack(rews, dim=1)
+        if run_mode == "early_stop":
+            rewards[episodes.finished] = 0
         global_reward = rewards.mean(dim=1)
         mean_global_reward = global_reward.mean(dim=0)
         total_reward += mean_global_reward
+        ended = episodes.update(s, dones, auto_reset=run_mode == "auto_reset")
 
-        if dones.all():
-            print("All elements are True")
+        if video_recorder is not None:
+            video_recorder.capture(env, s)
 
-        if render:
-            frame_list.append(
-                env.render(
-                    mode="rgb_array",
-                    agent_index_focus=None,
-                    visualize_when_rgb=True,
-                )
-            )
+        if run_mode == "early_stop" and episodes.completion_step is not None:
+            break
+        if run_mode == "auto_reset":
+            for env_index in torch.nonzero(ended).squeeze(-1).tolist():
+                obs = env.reset_at(env_index)
 
+    if video_recorder is not None:
+        video_recorder.close()
     total_time = time.time() - init_time
-    if render and save_render:
-        save_video(scenario_name, frame_list, 1 / env.scenario.world.dt)
 
     print(
-        f"It took: {total_time}s for {n_steps} steps of {n_envs} parallel environments on device {device}\n"
-        f"The average total reward was {total_reward}"
+        f"It took: {total_time}s for {step} steps of {n_envs} parallel environments on device {device}\n"
+        f"The average total reward was {total_reward}\n"
+        f"{len(episodes.episode_lengths)} episodes finished, "
+        f"mean length {episodes.get_mean_episode_length()}, all done at step {episodes.completion_step}"
     )
 
 
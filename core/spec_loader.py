@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import pickle
+import zlib
+
+from models.agent import Agent
+from models.goal import Goal
+from models.settings import Settings
+from models.simulation import Simulation
+from models.team import Team
+
+# The model schema is part of the cache key, bump for changes to the cache format or to the model validators
+CACHE_VERSION = 4
+SECTIONS = {"settings": Settings, "agents.item": Agent, "teams.item": Team, "goals.item": Goal}
+
+
+class SpecLoader:
+    def __init__(self, cache_dir=".tfm_cache/specs", max_cache_mb=256.0):
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, data_path) -> Simulation:
+        key = self._get_key(data_path)
+        simulation = self._read_cache(key)
+        if simulation is not None:
+            self.hits += 1
+            return simulation
+
+        self.misses += 1
+        simulation = self._parse(data_path)
+        self._write_cache(key, simulation)
+        return simulation
+
+    @staticmethod
+    def _get_key(data_path):
+        content_hash = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+        # Field names, types and defaults of all the models, so a changed model never reuses a stale pickle
+        content_hash.update(Simulation.schema_json().encode())
+        with open(data_path, 'rb') as json_file:
+            for chunk in iter(lambda: json_file.read(1024 * 1024), b''):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    @staticmethod
+    def _parse(data_path) -> Simulation:
+        try:
+            import ijson
+        except ImportError:
+            with open(data_path, 'r') as json_file:
+                return Simulation(**json.load(json_file))
+
+        # One pass over the parser events, each item is validated as soon as it is complete so only
+        # the validated models are kept instead of the whole document
+        sections = {"settings": None, "agents": [], "teams": [], "goals": []}
+        builder, builder_prefix = None, None
+        with open(data_path, 'rb') as json_file:
+            for prefix, event, value in ijson.parse(json_file, use_float=True):
+                if builder is None:
+                    if event in ("start_map", "start_array") and prefix in SECTIONS:
+                        builder, builder_prefix = ijson.ObjectBuilder(), prefix
+                        builder.event(event, value)
+                    continue
+                builder.event(event, value)
+                if event in ("end_map", "end_array") and prefix == builder_prefix:
+                    item = SECTIONS[prefix](**builder.value)
+                    section = prefix.split(".")[0]
+                    if section == "settings":
+                        sections[section] = item
+                    else:
+                        sections[section].append(item)
+                    builder = None
+        return Simulation(**sections)
+
+    def _get_cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl.z")
+
+    def _read_cache(self, key):
+        cache_path = self._get_cache_path(key)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path, 'rb') as cache_file:
+                simulation = pickle.loads(zlib.decompress(cache_file.read()))
+        except Exception:
+            os.remove(cache_path)
+            return None
+        os.utime(cache_path)  # Keeps recently used specs from being evicted
+        return simulation
+
+    def _write_cache(self, key, simulation):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_path = self._get_cache_path(key)
+        with open(cache_path + ".tmp", 'wb') as cache_file:
+            cache_file.write(zlib.compress(pickle.dumps(simulation, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(cache_path + ".tmp", cache_path)
+        self._evict()
+
+    def _evict(self):
+        cache_paths = sorted(
+            (os.path.join(self.cache_dir, file_name) for file_name in os.listdir(self.cache_dir)
+             if file_name.endswith(".pkl.z")),
+            key=os.path.getmtime,
+        )
+        cache_size = sum(os.path.getsize(cache_path) for cache_path in cache_paths)
+        # The least recently used specs go first, the newest one is always kept
+        for cache_path in cache_paths[:-1]:
+            if cache_size <= self.max_cache_bytes:
+                break
+            cache_size -= os.path.getsize(cache_path)
+            os.remove(cache_path)
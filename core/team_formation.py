@@ -0,0 +1,151 @@
+import hashlib
+import heapq
+import itertools
+import json
+import math
+from typing import Optional
+
+from models.agent import Agent
+from models.goal import Goal
+from models.team import Team
+
+
+class TeamFormationSolver:
+    # Branch and bound search of the teams of the ⟨A, P, f, α⟩ model that are c-costly, efficient for a goal
+    # (every task of the goal has an agent able to complete it) and k-robust (this still holds after any k agents fail)
+    def __init__(
+            self,
+            agents: list[Agent],
+            max_cost: Optional[float] = None,
+            max_size: int = 10,
+            k_robustness: int = 0,
+            top_n: Optional[int] = None,
+            prune_dominated: bool = True,
+    ):
+        self.agents = agents
+        self.max_cost = math.inf if max_cost is None else max_cost
+        self.max_size = max_size
+        self.k_robustness = k_robustness
+        self.top_n = top_n
+        self.prune_dominated = prune_dominated
+
+    def solve_all(self, goals: list[Goal], taken_ids=()) -> list[Team]:
+        # taken_ids are the ids of the existing teams, which generated teams must not reuse
+        teams = []
+        compositions = set()
+        team_ids = set(taken_ids)
+        for goal in goals:
+            for team in self.solve(goal):
+                composition = tuple(sorted(team.agents))
+                if composition not in compositions:
+                    compositions.add(composition)
+                    team_id = team.id
+                    for suffix in itertools.count(2):
+                        if team_id not in team_ids:
+                            break
+                        team_id = f"{team.id}_{suffix}"
+                    team_ids.add(team_id)
+                    teams.append(team.copy(update=dict(id=team_id)))
+        return teams
+
+    def solve(self, goal: Goal) -> list[Team]:
+        skills = sorted({task.environment for task in goal.tasks})
+        skill_bits = {skill: 1 << i for i, skill in enumerate(skills)}
+        required = (1 << len(skills)) - 1
+        need = self.k_robustness + 1
+
+        # Only agents with at least one of the required skills can be part of an efficient team
+        candidates = []
+        for agent in self.agents:
+            mask = 0
+            for skill in agent.skills:
+                mask |= skill_bits.get(skill, 0)
+            if mask:
+                candidates.append((agent.get_cost(), mask, agent.id))
+        candidates.sort()
+        if self.prune_dominated:
+            candidates = self._remove_dominated(candidates)
+
+        costs = [cost for cost, _, _ in candidates]
+        masks = [mask for _, mask, _ in candidates]
+        n_types = len(candidates)
+
+        # Skills and cheapest cost per skill still reachable from each candidate onwards, used as bounds
+        suffix_masks = [0] * (n_types + 1)
+        suffix_min_costs = [[math.inf] * len(skills) for _ in range(n_types + 1)]
+        for index in range(n_types - 1, -1, -1):
+            suffix_masks[index] = suffix_masks[index + 1] | masks[index]
+            for bit in range(len(skills)):
+                suffix_min_costs[index][bit] = suffix_min_costs[index + 1][bit]
+                if masks[index] >> bit & 1:
+                    suffix_min_costs[index][bit] = min(suffix_min_costs[index][bit], costs[index])
+
+        best = []  # Max-heap on cost of the best top_n teams found so far
+        tie_breaker = itertools.count()
+
+        def bound():
+            if self.top_n is not None and len(best) >= self.top_n:
+                return min(self.max_cost, -best[0][0])
+            return self.max_cost
+
+        def missing_mask(counts):
+            return sum(1 << bit for bit in range(len(skills)) if counts[bit] < need)
+
+        def is_minimal(counts, chosen):
+            # Removing any single agent must break k-robustness, otherwise the team has a useless agent
+            for index, copies in chosen:
+                if copies and all(counts[bit] - 1 >= need for bit in range(len(skills)) if masks[index] >> bit & 1):
+                    return False
+            return True
+
+        def search(index, counts, cost, size, chosen):
+            missing = missing_mask(counts)
+            if not missing:
+                if is_minimal(counts, chosen) and cost <= bound():
+                    team = [candidates[i][2] for i, copies in chosen for _ in range(copies)]
+                    heapq.heappush(best, (-cost, next(tie_breaker), team))
+                    if self.top_n is not None and len(best) > self.top_n:
+                        heapq.heappop(best)
+                return
+            if index == n_types or size == self.max_size or missing & suffix_masks[index] != missing:
+                return
+            lower_bound = max(
+                (need - counts[bit]) * suffix_min_costs[index][bit]
+                for bit in range(len(skills)) if missing >> bit & 1
+            )
+            if cost + lower_bound > bound():
+                return
+
+            if masks[index] & missing:
+                for copies in range(min(need, self.max_size - size), 0, -1):
+                    new_cost = cost + copies * costs[index]
+                    if new_cost > bound():
+                        continue
+                    new_counts = [
+                        count + copies if masks[index] >> bit & 1 else count for bit, count in enumerate(counts)
+                    ]
+                    search(index + 1, new_counts, new_cost, size + copies, chosen + [(index, copies)])
+            search(index + 1, counts, cost, size, chosen)
+
+        search(0, [0] * len(skills), 0, 0, [])
+
+        teams = sorted((-negative_cost, team) for negative_cost, _, team in best)
+        return [
+            Team(id=self.get_team_id(goal, team), k_robustness=self.k_robustness, agents=team)
+            for _, team in teams
+        ]
+
+    def get_team_id(self, goal: Goal, agent_ids: list[str]) -> str:
+        # Prefixed and derived from the composition, so that it stays the same across runs and stands apart from
+        # hand-written ids
+        composition = json.dumps([sorted(agent_ids), self.k_robustness])
+        return f"gen_{goal.id}_{hashlib.sha1(composition.encode()).hexdigest()[:8]}"
+
+    @staticmethod
+    def _remove_dominated(candidates):
+        # An agent is dominated by a cheaper (or equally priced, earlier) one whose skills include its skills
+        kept = []
+        for cost, mask, agent_id in candidates:
+            if not any(kept_mask & mask == mask for _, kept_mask, _ in kept):
+                kept.append((cost, mask, agent_id))
+        return kept
@@ -0,0 +1,92 @@
+import json
+import math
+import os
+import threading
+import time
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.category, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.durations = {}  # Phase name -> durations in seconds since the last pop_histograms
+
+    def span(self, name, category="simulation", **args):
+        # Disabled tracing hands out a shared no-op context manager, nothing is timed nor allocated
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def record(self, name, category, start, end, args=None):
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args or {},
+        })
+        self.durations.setdefault(name, []).append(end - start)
+
+    def pop_histograms(self) -> dict:
+        # Per phase count, total and percentiles, plus counts per power of two bucket of microseconds
+        histograms = {}
+        for name, durations in self.durations.items():
+            durations = sorted(durations)
+            buckets = {}
+            for duration in durations:
+                bucket = 2 ** max(math.ceil(math.log2(max(duration * 1e6, 1))), 0)
+                buckets[bucket] = buckets.get(bucket, 0) + 1
+            histograms[name] = {
+                "count": len(durations),
+                "total": sum(durations),
+                "p50": durations[len(durations) // 2],
+                "p99": durations[min(int(len(durations) * 0.99), len(durations) - 1)],
+                "buckets_us": buckets,
+            }
+        self.durations = {}
+        return histograms
+
+    def pop_events(self) -> list:
+        events, self.events = self.events, []
+        return events
+
+    @staticmethod
+    def export(path, events):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w') as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+
+tracer = Tracer()
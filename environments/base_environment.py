@@ -1,89 +1,264 @@
+import os
 import time
-import torch
 from abc import ABC
 
+import torch
+
 from vmas import make_env
-from vmas.simulator.utils import save_video
 
+from core.backend_registry import BackendRegistry
 from core.policy_provider import PolicyProvider
+from core.tracing import tracer
 from environments.env_parameters import EnvParameters
-from rllib.rllib_environment import RLlibEnvironment, supported_environments
+from environments.episode_tracker import EpisodeTracker
+from environments.metrics_recorder import MetricsRecorder
+from environments.trajectory_recorder import TrajectoryRecorder
+from environments.video_recorder import VideoRecorder
+from rllib.policy_store import PolicyStore
 
 
 class BaseEnvironment(ABC):
-    def __init__(self, name, n_agents, kwargs):
+    # Scenario arguments every job passes on top of the task's env_kwargs
+    SCENARIO_KWARGS = dict(random_package_pos_on_line=True, control_two_agents=True)
+
+    def __init__(
+            self, name, n_agents, kwargs, settings=None, env_pool=None, tags=None, n_envs=None, n_steps=None,
+            checkpoint=None,
+    ):
         self.name = name
-        policy = PolicyProvider.get_policy_for(name)
-        if policy is not None:
-            self.policy = policy(continuous_action=EnvParameters.CONTINUOUS_ACTIONS)
         self.n_agents = n_agents
         self.kwargs = kwargs
-        self.steps = EnvParameters.NUM_STEPS
-        self.n_envs = EnvParameters.NUM_ENVS
-        self.render = True
-        self.save_render = True
-        self.env = self._initialize_environment()
-        if policy is not None:
+        self.env_pool = env_pool
+        self.tags = tags or {}
+        self.steps = n_steps or EnvParameters.NUM_STEPS
+        self.n_envs = n_envs or EnvParameters.NUM_ENVS
+        self.settings = settings
+        self.render = settings is not None and settings.render
+        self.save_render = settings is not None and settings.save
+        self.total_reward = None
+        self.total_time = None
+        self.construction_time = None
+        self.phase_histograms = {}
+        self.metrics = None
+        self.episodes = None
+        self.trajectories = None
+        self.run_mode = settings.run_mode if settings is not None else "fixed"
+        self.seed = settings.seed if settings is not None else None
+        # RLlib scenarios are either trained, or evaluated here with a trained checkpoint like the heuristic ones
+        self.backend = BackendRegistry.get_backend_name(name, settings.rllib_mode if settings is not None else "train")
+        self.policy = self._create_policy(checkpoint)
+        init_time = time.time()
+        with tracer.span("env_construction", "setup", scenario=name, n_agents=n_agents):
+            self.env = self._initialize_environment()
+        self.construction_time = time.time() - init_time
+        if self.policy is not None:
             self._run()
 
+    def _create_policy(self, checkpoint):
+        if self.backend == "rllib_train":
+            return None  # Trained by RLlib
+        elif self.backend == "vmas":
+            return PolicyProvider.get_batched_policy_for(
+                self.name,
+                EnvParameters.CONTINUOUS_ACTIONS,
+                compiled=self.settings is not None and self.settings.compile_policies,
+            )
+        if checkpoint is None and self.settings.policy_store_dir is not None:
+            entry, exact = PolicyStore(self.settings.policy_store_dir).find(
+                self.name, self.n_agents, *self._get_failure_config()
+            )
+            if entry is not None:
+                if not exact:
+                    print(f"No policy trained with these failure settings, evaluating {entry['checkpoint']}")
+                checkpoint = entry["checkpoint"]
+        if checkpoint is None:
+            raise ValueError(f"No trained '{self.name}' policy for {self.n_agents} agents to run in inference mode")
+        return BackendRegistry.load("rllib_inference").load(checkpoint, EnvParameters.DEVICE)
+
+    def _get_failure_config(self):
+        # (k_robustness, failure_probability) the RLlib policy is trained with
+        return 0, 0.0
+
     def _initialize_environment(self):
-        if self.name in supported_environments:
+        if self.backend == "rllib_train":
             return self._initialize_rllib()
+        elif self.env_pool is not None:
+            key = self.env_pool.get_key(**self._get_env_config())
+            return self.env_pool.get(key, self._make_env)
         else:
-            return make_env(
-                scenario=self.name,
-                n_agents=self.n_agents,
-                num_envs=self.n_envs,
-                device=EnvParameters.DEVICE,
-                continuous_actions=EnvParameters.CONTINUOUS_ACTIONS,
-                wrapper=EnvParameters.WRAPPER,
-                random_package_pos_on_line=True,
-                control_two_agents=True,
-                **self.kwargs)
+            return self._make_env()
+
+    def _get_env_config(self):
+        return dict(
+            scenario=self.name,
+            n_agents=self.n_agents,
+            num_envs=self.n_envs,
+            device=EnvParameters.DEVICE,
+            continuous_actions=EnvParameters.CONTINUOUS_ACTIONS,
+            wrapper=EnvParameters.WRAPPER,
+            seed=self.seed,
+            **self.SCENARIO_KWARGS,
+            **self.kwargs)
+
+    def _make_env(self):
+        return make_env(**self._get_env_config())
 
     def _run(self):
-        frame_list = []  # For creating a gif
         init_time = time.time()
+        step = self._simulate()
+        total_time = time.time() - init_time
+        total_reward = self.metrics.get_total_reward()
+        self.total_reward = total_reward
+        self.total_time = total_time
+        self.phase_histograms = tracer.pop_histograms()
+        self._save_metrics()
+        self._save_trajectories()
+
+        print(
+            f"It took: {total_time}s for {step} steps of {self.n_envs} parallel environments\n"
+            f"The average total reward was {total_reward}\n"
+            f"{len(self.episodes.episode_lengths)} episodes finished, "
+            f"mean length {self.episodes.get_mean_episode_length()}, all done at step {self.episodes.completion_step}"
+        )
+        for phase, histogram in self.phase_histograms.items():
+            print(f"{phase}: {histogram['count']} calls, {histogram['total']:.3f}s, p50 {histogram['p50'] * 1e3:.3f}ms")
+
+    def _simulate(self, suffix="", round_index=0):
+        video_recorder = self._create_video_recorder(suffix)
+        self.metrics = MetricsRecorder(self.steps, self.n_envs, self.n_agents, EnvParameters.DEVICE)
+        self.episodes = EpisodeTracker(self.n_envs, EnvParameters.DEVICE)
+        self.trajectories = self._create_trajectory_recorder()
+        auto_reset = self.run_mode == "auto_reset"
         step = 0
+        if self.seed is not None:
+            # Pooled environments carry the random state of earlier jobs, every run starts from its own seed
+            self.env.seed(self.seed + round_index)
         obs = self.env.reset()
-        total_reward = 0
+        self._on_reset()
+        if self.trajectories is not None:
+            self.trajectories.record(0, self.env, self.get_active_agents())
+        u_ranges = [agent.u_range for agent in self.env.agents]
         for s in range(self.steps):
             step += 1
-            actions = [None] * len(obs)
-            for i in range(len(obs)):
-                if self.is_agent_active(i):
-                    actions[i] = self.policy.compute_action(obs[i], u_range=self.env.agents[i].u_range)
-                else:
-                    actions[i] = self.policy.compute_action(obs[i], u_range=0.0)
-            obs, rews, dones, info = self.env.step(actions)
-            rewards = torch.stack(rews, dim=1)
-            global_reward = rewards.mean(dim=1)
-            mean_global_reward = global_reward.mean(dim=0)
-            total_reward += mean_global_reward
-
-            if dones.all():
-                print("All elements are True")
-
-            if self.render:
-                frame_list.append(
-                    self.env.render(
-                        mode="rgb_array",
-                        agent_index_focus=None,
-                        visualize_when_rgb=True,
-                    )
-                )
+            with tracer.span("failure_sampling"):
+                active_agents = self.get_active_agents()
+            with tracer.span("policy"):
+                actions = self.policy.compute_actions(obs, u_ranges, active_agents)
+            with tracer.span("env_step"):
+                obs, rews, dones, info = self.env.step(actions)
+            with tracer.span("failure_sampling"):
+                self._on_step()
+            with tracer.span("reward_aggregation"):
+                # Once an episode ended without reset, the steps of its environment do not count anymore
+                running = ~self.episodes.finished if self.run_mode == "early_stop" else None
+                self.metrics.record(s, rews, dones, active_agents, running)
+                ended = self.episodes.update(s, dones, auto_reset)
 
-        total_time = time.time() - init_time
-        if self.render and self.save_render:
-            save_video(self.name, frame_list, 1 / self.env.scenario.world.dt)
+            if video_recorder is not None:
+                with tracer.span("render"):
+                    video_recorder.capture(self.env, s)
+            if self.trajectories is not None:
+                with tracer.span("trajectory_recording"):
+                    self.trajectories.record(s + 1, self.env, active_agents)
 
-        print(
-            f"It took: {total_time}s for {self.steps} steps of {self.n_envs} parallel environments\n"
-            f"The average total reward was {total_reward}"
+            if self.run_mode == "early_stop" and self.episodes.completion_step is not None:
+                break
+            if auto_reset:
+                for env_index in torch.nonzero(ended).squeeze(-1).tolist():
+                    obs = self.env.reset_at(env_index)
+                    self._on_reset_at(env_index)
+
+        if video_recorder is not None:
+            video_recorder.close()
+        return step
+
+    def _save_metrics(self, suffix=""):
+        if self.settings is not None and self.settings.metrics_dir is not None:
+            self.metrics.save(
+                os.path.join(self.settings.metrics_dir, self._get_output_name() + suffix + ".npz"),
+                dict(scenario=self.name, n_agents=self.n_agents, **self.tags),
+            )
+
+    def _save_trajectories(self, suffix=""):
+        if self.trajectories is not None:
+            self.trajectories.save(
+                os.path.join(self.settings.trajectory_dir, self._get_output_name() + suffix + ".npz"),
+                {key: value for key, value in self._get_env_config().items() if key not in ["num_envs", "device"]},
+                self.env.scenario.world.dt,
+                dict(scenario=self.name, n_agents=self.n_agents, **self.tags),
+            )
+
+    def get_env_outcomes(self, metric):
+        # Per environment sample of the last run: whether its episode was completed, or its total reward
+        if metric == "success":
+            return self.episodes.finished
+        elif metric == "reward":
+            return self.metrics.rewards[:self.metrics.n_recorded].mean(dim=2).sum(dim=0)
+        else:
+            raise ValueError(f"Unknown metric '{metric}'")
+
+    def get_episode_stats(self):
+        if self.episodes is None:
+            return {}
+        return dict(
+            n_episodes=len(self.episodes.episode_lengths),
+            mean_episode_length=self.episodes.get_mean_episode_length(),
+            completion_step=self.episodes.completion_step,
+        )
+
+    def get_estimate_stats(self):
+        return {}
+
+    def get_sweep_stats(self):
+        return {}
+
+    def _create_video_recorder(self, suffix=""):
+        if not self.render:
+            return None
+        return VideoRecorder(
+            name=self._get_output_name() + suffix,
+            fps=1 / self.env.scenario.world.dt,
+            stride=self.settings.render_stride,
+            max_resolution=self.settings.render_max_resolution,
+            env_index=self.settings.render_env_index,
+            queue_size=self.settings.render_queue_size,
+            save=self.save_render,
+        )
+
+    def _create_trajectory_recorder(self):
+        if self.settings is None or self.settings.trajectory_dir is None:
+            return None
+        env_indices = [env_index for env_index in self.settings.trajectory_envs if env_index < self.n_envs]
+        return TrajectoryRecorder(
+            self.steps, env_indices, len(self.env.world.entities), self.n_agents, EnvParameters.DEVICE
         )
 
+    def _get_output_name(self):
+        return "_".join([self.name] + [str(value) for value in self.tags.values()])
+
     def _initialize_rllib(self):
-        return RLlibEnvironment(self.name, self.n_agents)
+        return BackendRegistry.load("rllib_train")(self.name, self.n_agents, **self._get_rllib_kwargs())
+
+    def _get_rllib_kwargs(self):
+        kwargs = {}
+        if self.settings is not None:
+            kwargs["render_stride"] = self.settings.render_stride
+            kwargs["num_vectorized_envs"] = self.settings.rllib_num_envs_per_worker
+            kwargs["num_workers"] = self.settings.rllib_num_workers
+        if self.settings is not None and self.settings.policy_store_dir is not None:
+            kwargs["policy_store"] = PolicyStore(self.settings.policy_store_dir)
+            kwargs["warm_start_iterations"] = self.settings.warm_start_iterations
+        return kwargs
+
+    def _on_reset(self):
+        pass
+
+    def _on_reset_at(self, env_index):
+        pass
+
+    def _on_step(self):
+        pass
 
-    def is_agent_active(self, agent_index):
-        return True
+    def get_active_agents(self):
+        # [num_envs, n_agents] bool mask of the agents still working, None when all of them are
+        return None
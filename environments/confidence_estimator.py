@@ -0,0 +1,41 @@
+import math
+from statistics import NormalDist
+
+
+class ConfidenceEstimator:
+    # Running estimate of a success rate (Wilson interval) or of a mean (normal interval) over Monte Carlo samples
+    def __init__(self, metric="success", confidence=0.95):
+        self.metric = metric
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.n_samples = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+
+    def add(self, samples):
+        samples = samples.double()
+        self.n_samples += samples.numel()
+        self.total += samples.sum().item()
+        self.total_squares += (samples ** 2).sum().item()
+
+    def get_mean(self):
+        return self.total / self.n_samples if self.n_samples else None
+
+    def get_interval(self):
+        if self.n_samples == 0:
+            return -math.inf, math.inf
+        n, z, mean = self.n_samples, self.z, self.get_mean()
+        if self.metric == "success":
+            denominator = 1 + z ** 2 / n
+            center = (mean + z ** 2 / (2 * n)) / denominator
+            half_width = z * math.sqrt(mean * (1 - mean) / n + z ** 2 / (4 * n ** 2)) / denominator
+        else:
+            if n < 2:
+                return -math.inf, math.inf
+            variance = max(self.total_squares - n * mean ** 2, 0.0) / (n - 1)
+            center = mean
+            half_width = z * math.sqrt(variance / n)
+        return center - half_width, center + half_width
+
+    def get_width(self):
+        low, high = self.get_interval()
+        return high - low
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+import torch
+
+
+def estimate_env_memory(env) -> int:
+    # Bytes held by the tensors of the world entities and the scenario, which dominate a VMAS environment
+    tensors = []
+    for entity in env.world.entities:
+        tensors += vars(entity.state).values()
+    for agent in env.world.agents:
+        tensors += vars(agent.action).values()
+    tensors += vars(env.scenario).values()
+    return sum(tensor.element_size() * tensor.nelement() for tensor in tensors if isinstance(tensor, torch.Tensor))
+
+
+class EnvironmentPool:
+    def __init__(self, memory_budget_mb: float):
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.environments = OrderedDict()  # key -> (env, size, construction_time), least recently used first
+        self.memory_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.construction_time_saved = 0.0
+
+    @staticmethod
+    def get_key(**config) -> str:
+        return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key, factory):
+        if key in self.environments:
+            env, size, construction_time = self.environments[key]
+            self.environments.move_to_end(key)
+            self.hits += 1
+            self.construction_time_saved += construction_time
+            return env  # Not reset here, every run resets the environment before its first step
+
+        self.misses += 1
+        init_time = time.time()
+        env = factory()
+        construction_time = time.time() - init_time
+        size = estimate_env_memory(env)
+        self.environments[key] = (env, size, construction_time)
+        self.memory_used += size
+        self._evict()
+        return env
+
+    def _evict(self):
+        while self.memory_used > self.memory_budget and self.environments:
+            _, (_, size, _) = self.environments.popitem(last=False)
+            self.memory_used -= size
+            self.evictions += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "construction_time_saved": self.construction_time_saved,
+        }
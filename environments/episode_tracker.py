@@ -0,0 +1,26 @@
+import torch
+
+
+class EpisodeTracker:
+    def __init__(self, num_envs, device="cpu"):
+        self.episode_steps = torch.zeros(num_envs, dtype=torch.long, device=device)
+        self.finished = torch.zeros(num_envs, dtype=torch.bool, device=device)  # Completed at least one episode
+        self.episode_lengths = []
+        self.completion_step = None  # Step at which every environment had completed an episode
+
+    def update(self, step, dones, auto_reset=False):
+        self.episode_steps += 1
+        # Without resets a finished environment stays done, only its first episode counts
+        ended = dones if auto_reset else dones & ~self.finished
+        if ended.any():
+            self.episode_lengths += self.episode_steps[ended].tolist()
+            self.episode_steps[ended] = 0
+            self.finished |= ended
+            if self.completion_step is None and self.finished.all():
+                self.completion_step = step + 1
+        return ended
+
+    def get_mean_episode_length(self):
+        if not self.episode_lengths:
+            return None
+        return sum(self.episode_lengths) / len(self.episode_lengths)
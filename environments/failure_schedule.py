@@ -0,0 +1,133 @@
+import math
+from typing import Optional
+
+import torch
+
+
+class HazardModel:
+    # Samples, for every environment and agent, the step at which the agent fails (inf if it never fails).
+    # env_index restricts per-environment parameters to the environment being reset.
+    def sample(self, shape, generator: Optional[torch.Generator] = None, device="cpu", env_index=None) -> torch.Tensor:
+        raise NotImplementedError
+
+
+class BernoulliHazard(HazardModel):
+    def __init__(self, probability):
+        # A float, or a [num_envs] tensor when every environment has its own probability
+        self.probability = probability
+
+    def sample(self, shape, generator=None, device="cpu", env_index=None):
+        if isinstance(self.probability, torch.Tensor):
+            return self._sample_per_env(shape, generator, device, env_index)
+        if self.probability <= 0:
+            return torch.full(shape, math.inf, device=device)
+        if self.probability >= 1:
+            return torch.zeros(shape, device=device)
+        # Number of successful steps before the first failure of a per-step Bernoulli trial is geometric
+        uniform = torch.rand(shape, generator=generator, device=device)
+        return torch.floor(torch.log1p(-uniform) / math.log1p(-self.probability))
+
+    def _sample_per_env(self, shape, generator, device, env_index):
+        probability = self.probability if env_index is None else self.probability[env_index:env_index + 1]
+        probability = probability.to(device).unsqueeze(-1).expand(shape)
+        uniform = torch.rand(shape, generator=generator, device=device)
+        failure_steps = torch.floor(torch.log1p(-uniform) / torch.log1p(-probability.clamp(max=1 - 1e-7)))
+        failure_steps[probability <= 0] = math.inf
+        failure_steps[probability >= 1] = 0
+        return failure_steps
+
+
+class FixedScheduleHazard(HazardModel):
+    def __init__(self, steps: list):
+        # One failure step per agent, None means the agent never fails
+        self.steps = [math.inf if step is None else step for step in steps]
+
+    def sample(self, shape, generator=None, device="cpu", env_index=None):
+        assert len(self.steps) == shape[-1], f"Expecting {shape[-1]} failure steps, got {len(self.steps)}"
+        return torch.tensor(self.steps, dtype=torch.float32, device=device).expand(shape).clone()
+
+
+class WeibullHazard(HazardModel):
+    def __init__(self, shape: float, scale: float):
+        self.shape = shape
+        self.scale = scale
+
+    def sample(self, shape, generator=None, device="cpu", env_index=None):
+        uniform = torch.rand(shape, generator=generator, device=device)
+        return torch.floor(self.scale * (-torch.log1p(-uniform)) ** (1 / self.shape))
+
+
+HAZARD_MODELS = {
+    "bernoulli": BernoulliHazard,
+    "fixed": FixedScheduleHazard,
+    "weibull": WeibullHazard,
+}
+
+
+def make_hazard_model(settings, failure_probability=None) -> HazardModel:
+    # failure_probability overrides the one of the settings, possibly with a [num_envs] tensor
+    if failure_probability is None:
+        failure_probability = settings.failure_probability
+    if settings.failure_model == "bernoulli":
+        # Same per-step rate as the former random.choices([True, False], weights=[10 - p, p])
+        return BernoulliHazard(failure_probability / 10)
+    if settings.failure_model not in HAZARD_MODELS:
+        raise ValueError(f"Unknown failure model '{settings.failure_model}', expected one of {list(HAZARD_MODELS)}")
+    return HAZARD_MODELS[settings.failure_model](**settings.failure_model_params)
+
+
+def make_generator(seed: Optional[int], device="cpu") -> Optional[torch.Generator]:
+    if seed is None:
+        return None
+    return torch.Generator(device=device).manual_seed(seed)
+
+
+class FailureSchedule:
+    def __init__(
+            self,
+            hazard: HazardModel,
+            num_envs: int,
+            n_agents: int,
+            k_robustness,
+            device="cpu",
+            generator: Optional[torch.Generator] = None,
+    ):
+        self.hazard = hazard
+        self.num_envs = num_envs
+        self.n_agents = n_agents
+        # An int, or a [num_envs] tensor when every environment has its own k_robustness
+        self.k_robustness = torch.as_tensor(k_robustness, device=device).expand(num_envs)
+        self.device = device
+        self.generator = generator
+        self.failure_steps = torch.full((num_envs, n_agents), math.inf, device=device)
+        self.steps = torch.zeros(num_envs, device=device)
+
+    def reset(self):
+        self.steps.zero_()
+        self.failure_steps = self._sample()
+
+    def reset_at(self, env_index):
+        self.steps[env_index] = 0
+        self.failure_steps[env_index] = self._sample(env_index)[0]
+
+    def _sample(self, env_index=None):
+        k_robustness = self.k_robustness if env_index is None else self.k_robustness[env_index:env_index + 1]
+        num_envs = len(k_robustness)
+        # Agents can fail only while more than n_agents - k_robustness are active, as in the former per-step check
+        can_fail = 0 < self.n_agents - k_robustness
+        if not can_fail.any():
+            return torch.full((num_envs, self.n_agents), math.inf, device=self.device)
+
+        failure_steps = self.hazard.sample((num_envs, self.n_agents), self.generator, self.device, env_index)
+        # Only the first k_robustness failures of each environment happen
+        ranks = failure_steps.argsort(dim=1).argsort(dim=1)
+        failure_steps[ranks >= k_robustness.unsqueeze(-1)] = math.inf
+        failure_steps[~can_fail] = math.inf
+        return failure_steps
+
+    def step(self):
+        self.steps += 1
+
+    def active(self) -> torch.Tensor:
+        # [num_envs, n_agents] bool mask of agents that have not failed yet
+        return self.steps.unsqueeze(-1) < self.failure_steps
@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+import torch
+
+
+class MetricsRecorder:
+    def __init__(self, n_steps, num_envs, n_agents, device="cpu"):
+        self.num_envs = num_envs
+        # Allocated once per job and filled in place on every step
+        self.rewards = torch.zeros(n_steps, num_envs, n_agents, device=device)
+        self.dones = torch.zeros(n_steps, num_envs, dtype=torch.bool, device=device)
+        self.active_agents = torch.ones(n_steps, num_envs, n_agents, dtype=torch.bool, device=device)
+        self.n_recorded = 0
+
+    def record(self, step, rews, dones, active_agents=None, running=None):
+        for i, reward in enumerate(rews):
+            self.rewards[step, :, i] = reward.reshape(self.num_envs)
+        if running is not None:
+            self.rewards[step] *= running.unsqueeze(-1)
+        self.dones[step] = dones
+        if active_agents is not None:
+            self.active_agents[step] = active_agents
+        self.n_recorded = step + 1
+
+    def get_total_reward(self) -> float:
+        # Sum over the steps of the reward averaged over agents and environments
+        return self.rewards[:self.n_recorded].mean(dim=2).mean(dim=1).sum().item()
+
+    def save(self, path, tags: dict):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            rewards=self.rewards[:self.n_recorded].cpu().numpy(),
+            dones=self.dones[:self.n_recorded].cpu().numpy(),
+            active_agents=self.active_agents[:self.n_recorded].cpu().numpy(),
+            **{f"tag_{key}": np.array(value) for key, value in tags.items()},
+        )
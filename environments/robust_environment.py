@@ -1,26 +1,139 @@
-import random
+import itertools
+import time
 
+import torch
+
+from core.backend_registry import BackendRegistry
+from core.tracing import tracer
 from environments.base_environment import BaseEnvironment
-from rllib.rllib_environment import RLlibEnvironment
+from environments.confidence_estimator import ConfidenceEstimator
+from environments.env_parameters import EnvParameters
+from environments.failure_schedule import FailureSchedule, make_generator, make_hazard_model
 
 
 class RobustEnvironment(BaseEnvironment):
-    def __init__(self, name, n_agents, kwargs, settings, k_robustness):
+    def __init__(
+            self, name, n_agents, kwargs, settings, k_robustness, env_pool=None, tags=None, n_envs=None, n_steps=None,
+            checkpoint=None,
+    ):
         self.settings = settings
-        self.agents_status = [True] * n_agents
         self.k_robustness = k_robustness
-        super().__init__(name, n_agents, kwargs)
+        self.failure_schedule = None
+        self.estimator = None
+        self.sweep_cells = None
+        # Sweeps are simulated, an RLlib job that is trained keeps its own failure settings
+        if settings.is_sweep() and BackendRegistry.get_backend_name(name, settings.rllib_mode) != "rllib_train":
+            # Each (failure_probability, k_robustness) cell gets its own slice of the batch
+            self.sweep_cells = list(itertools.product(
+                settings.sweep_failure_probabilities or [settings.failure_probability],
+                settings.sweep_k_robustness or [k_robustness],
+            ))
+            n_envs = len(self.sweep_cells) * settings.sweep_envs_per_cell
+        # In adaptive mode each round simulates a smaller batch of episodes
+        elif settings.adaptive_ci_width is not None:
+            n_envs = settings.adaptive_round_envs
+        super().__init__(name, n_agents, kwargs, settings, env_pool, tags, n_envs, n_steps, checkpoint)
+
+    def _run(self):
+        if self.sweep_cells is not None:
+            super()._run()
+            for cell in self.get_sweep_stats()["sweep"]:
+                print(
+                    f"p={cell['failure_probability']} k={cell['k_robustness']}: reward {cell['total_reward']}, "
+                    f"{cell['success_rate']:.1%} completed, {cell['mean_failed_agents']:.2f} failed agents"
+                )
+            return
+        if self.settings.adaptive_ci_width is None:
+            return super()._run()
+
+        self.estimator = ConfidenceEstimator(self.settings.adaptive_metric, self.settings.adaptive_confidence)
+        round_rewards = []
+        init_time = time.time()
+        for round_index in range(self.settings.adaptive_max_rounds):
+            # Each round writes its own video, metrics and trajectories
+            suffix = f"_round{round_index}"
+            self._simulate(suffix, round_index)
+            self._save_metrics(suffix)
+            self._save_trajectories(suffix)
+            round_rewards.append(self.metrics.get_total_reward())
+            self.estimator.add(self.get_env_outcomes(self.settings.adaptive_metric))
+            if self.estimator.get_width() <= self.settings.adaptive_ci_width:
+                break
+        self.total_time = time.time() - init_time
+        self.total_reward = sum(round_rewards) / len(round_rewards)
+        self.phase_histograms = tracer.pop_histograms()
+
+        low, high = self.estimator.get_interval()
+        print(
+            f"It took: {self.total_time}s for {len(round_rewards)} rounds of {self.n_envs} parallel environments\n"
+            f"The average total reward was {self.total_reward}\n"
+            f"The {self.settings.adaptive_metric} estimate is {self.estimator.get_mean()} "
+            f"in [{low}, {high}] from {self.estimator.n_samples} samples"
+        )
+
+    def get_estimate_stats(self):
+        if self.estimator is None:
+            return {}
+        return dict(
+            n_samples=self.estimator.n_samples,
+            estimate=self.estimator.get_mean(),
+            interval=list(self.estimator.get_interval()),
+        )
+
+    def get_sweep_stats(self):
+        if self.sweep_cells is None or self.metrics is None:
+            return {}
+        envs_per_cell = self.settings.sweep_envs_per_cell
+        rewards = self.get_env_outcomes("reward")
+        finished = self.episodes.finished.float()
+        failed_agents = (~self.metrics.active_agents[self.metrics.n_recorded - 1]).sum(dim=1).float()
+        sweep = []
+        for i, (failure_probability, k_robustness) in enumerate(self.sweep_cells):
+            cell = slice(i * envs_per_cell, (i + 1) * envs_per_cell)
+            sweep.append(dict(
+                failure_probability=failure_probability,
+                k_robustness=k_robustness,
+                n_envs=envs_per_cell,
+                total_reward=rewards[cell].mean().item(),
+                success_rate=finished[cell].mean().item(),
+                mean_failed_agents=failed_agents[cell].mean().item(),
+            ))
+        return dict(sweep=sweep)
+
+    def _on_reset(self):
+        if self.failure_schedule is None:
+            failure_probability, k_robustness = None, self.k_robustness
+            if self.sweep_cells is not None:
+                cells = torch.tensor(self.sweep_cells, device=EnvParameters.DEVICE)
+                failure_probability = cells[:, 0].repeat_interleave(self.settings.sweep_envs_per_cell)
+                k_robustness = cells[:, 1].long().repeat_interleave(self.settings.sweep_envs_per_cell)
+            self.failure_schedule = FailureSchedule(
+                hazard=make_hazard_model(self.settings, failure_probability),
+                num_envs=self.n_envs,
+                n_agents=self.n_agents,
+                k_robustness=k_robustness,
+                device=EnvParameters.DEVICE,
+                generator=make_generator(self.settings.seed, EnvParameters.DEVICE),
+            )
+        self.failure_schedule.reset()
+
+    def _on_reset_at(self, env_index):
+        self.failure_schedule.reset_at(env_index)
 
-    def is_agent_active(self, agent_index):
-        # print(self.agents_status, sum(self.agents_status), agent_index)
-        if 0 < (self.n_agents - self.k_robustness) < sum(self.agents_status) and self.agents_status[agent_index]:
-            self.agents_status[agent_index] = self.probability_of_failure()
+    def _on_step(self):
+        self.failure_schedule.step()
 
-        return self.agents_status[agent_index]
+    def get_active_agents(self):
+        return self.failure_schedule.active()
 
-    def probability_of_failure(self):
-        probability = self.settings.failure_probability
-        return random.choices([True, False], weights=[10 - probability, probability])[0]
+    def _get_failure_config(self):
+        return self.k_robustness, self.settings.failure_probability
 
     def _initialize_rllib(self):
-        return RLlibEnvironment(self.name, self.n_agents, self.k_robustness, self.settings.failure_probability)
+        return BackendRegistry.load("rllib_train")(
+            self.name,
+            self.n_agents,
+            self.k_robustness,
+            self.settings.failure_probability,
+            **self._get_rllib_kwargs(),
+        )
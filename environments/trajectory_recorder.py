@@ -0,0 +1,38 @@
+import json
+import os
+
+import numpy as np
+import torch
+
+
+class TrajectoryRecorder:
+    # Positions and rotations of every entity, and the failure mask, of a few environments. Enough to render
+    # them later without running the policies or the physics again. Frame 0 is the state after the reset,
+    # frame s + 1 the state after step s.
+    def __init__(self, n_steps, env_indices, n_entities, n_agents, device="cpu"):
+        self.env_indices = torch.tensor(env_indices, dtype=torch.long, device=device)
+        self.positions = torch.zeros(n_steps + 1, len(env_indices), n_entities, 2, device=device)
+        self.rotations = torch.zeros(n_steps + 1, len(env_indices), n_entities, device=device)
+        self.active_agents = torch.ones(n_steps + 1, len(env_indices), n_agents, dtype=torch.bool, device=device)
+        self.n_recorded = 0
+
+    def record(self, frame, env, active_agents=None):
+        for i, entity in enumerate(env.world.entities):
+            self.positions[frame, :, i] = entity.state.pos[self.env_indices]
+            self.rotations[frame, :, i] = entity.state.rot[self.env_indices, 0]
+        if active_agents is not None:
+            self.active_agents[frame] = active_agents[self.env_indices]
+        self.n_recorded = frame + 1
+
+    def save(self, path, env_config: dict, dt: float, tags: dict):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            positions=self.positions[:self.n_recorded].cpu().numpy().astype(np.float32),
+            rotations=self.rotations[:self.n_recorded].cpu().numpy().astype(np.float32),
+            active_agents=self.active_agents[:self.n_recorded].cpu().numpy(),
+            env_indices=self.env_indices.cpu().numpy(),
+            env_config=np.array(json.dumps(env_config, default=str)),
+            dt=np.array(dt),
+            **{f"tag_{key}": np.array(value) for key, value in tags.items()},
+        )
@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import torch
+from vmas import make_env
+
+from environments.video_recorder import VideoRecorder
+
+FAILED_AGENT_COLOR = (0.6, 0.6, 0.6)
+
+
+class TrajectoryReplayer:
+    # Rebuilds the scene of a recorded trajectory and renders it, only entity states are set on every frame
+    def __init__(self, path):
+        with np.load(path) as trajectory:
+            self.positions = torch.from_numpy(trajectory["positions"])
+            self.rotations = torch.from_numpy(trajectory["rotations"])
+            self.active_agents = torch.from_numpy(trajectory["active_agents"])
+            self.env_indices = trajectory["env_indices"].tolist()
+            self.env_config = json.loads(trajectory["env_config"].item())
+            self.dt = float(trajectory["dt"])
+        self.name = os.path.splitext(path)[0]
+
+    def render(self, recorded_index=0, stride=1, max_resolution=None, name=None):
+        env = make_env(**dict(self.env_config, num_envs=1, device="cpu"))
+        env.reset()
+        agent_colors = [agent.color for agent in env.world.agents]
+        video_recorder = VideoRecorder(
+            name=name or f"{self.name}_env{self.env_indices[recorded_index]}",
+            fps=1 / self.dt,
+            stride=stride,
+            max_resolution=max_resolution,
+        )
+        try:
+            for step in range(len(self.positions)):
+                if step % stride != 0:
+                    continue
+                for i, entity in enumerate(env.world.entities):
+                    entity.set_pos(self.positions[step, recorded_index, i].unsqueeze(0), batch_index=0)
+                    entity.set_rot(self.rotations[step, recorded_index, i].view(1, 1), batch_index=0)
+                for i, agent in enumerate(env.world.agents):
+                    active = self.active_agents[step, recorded_index, i]
+                    agent.color = agent_colors[i] if active else FAILED_AGENT_COLOR
+                video_recorder.capture(env, step)
+        finally:
+            video_recorder.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renders recorded trajectories to mp4 videos")
+    parser.add_argument("trajectories", nargs="+", help="trajectory .npz files saved by a run")
+    parser.add_argument("--env", type=int, nargs="*", help="positions of the recorded environments to render")
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--max-resolution", type=int)
+    args = parser.parse_args()
+
+    for path in args.trajectories:
+        replayer = TrajectoryReplayer(path)
+        for recorded_index in args.env if args.env is not None else range(len(replayer.env_indices)):
+            replayer.render(recorded_index, args.stride, args.max_resolution)
+
+
+if __name__ == '__main__':
+    main()
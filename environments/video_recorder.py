@@ -0,0 +1,83 @@
+import queue
+import threading
+from typing import Optional
+
+
+class VideoRecorder:
+    def __init__(
+            self,
+            name: str,
+            fps: float,
+            stride: int = 1,
+            max_resolution: Optional[int] = None,
+            env_index: int = 0,
+            queue_size: int = 32,
+            save: bool = True,
+    ):
+        self.name = name
+        self.fps = fps / stride
+        self.stride = stride
+        self.max_resolution = max_resolution
+        self.env_index = env_index
+        self.save = save
+        self.error = None
+        # Bounded, so the simulation waits for the encoder instead of piling frames up in memory
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        if save:
+            self.thread = threading.Thread(target=self._encode, name=f"VideoRecorder-{name}", daemon=True)
+            self.thread.start()
+
+    def capture(self, env, step):
+        if step % self.stride != 0:
+            return
+        if self.error is not None:
+            raise self.error
+        frame = env.render(
+            mode="rgb_array",
+            env_index=self.env_index,
+            agent_index_focus=None,
+            visualize_when_rgb=True,
+        )
+        if self.save:
+            self.frames.put(frame)
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.frames.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _encode(self):
+        import cv2
+
+        video = None
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue  # Keep draining so the simulation never blocks on a dead encoder
+            try:
+                frame = self._resize(cv2, frame)
+                if video is None:
+                    video = cv2.VideoWriter(
+                        self.name + ".mp4",
+                        cv2.VideoWriter_fourcc(*"mp4v"),
+                        self.fps,
+                        (frame.shape[1], frame.shape[0]),
+                    )
+                video.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            except Exception as error:
+                self.error = error
+        if video is not None:
+            video.release()
+
+    def _resize(self, cv2, frame):
+        height, width = frame.shape[:2]
+        if self.max_resolution is None or max(height, width) <= self.max_resolution:
+            return frame
+        scale = self.max_resolution / max(height, width)
+        return cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
@@ -5,7 +5,7 @@ from pydantic import BaseModel
 class Agent(BaseModel):
     id: str
     skills: list[str]
-    cost = int
+    cost: int = 0
 
     # fun_cost = fun_cost
     # def __init__(self, skills, cost=0, fun_cost=None):
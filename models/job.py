@@ -0,0 +1,43 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+from models.settings import Settings
+from models.task import Task
+
+
+class Job(BaseModel):
+    id: int
+    goal_id: str
+    task_index: int
+    task: Task
+    team_id: str
+    n_agents: int
+    k_robustness: int = 0
+    n_envs: Optional[int] = None  # Parallel environments, None for the default of the environment
+    agent_skills: list[list[str]] = []  # Skills of the agents of the team that take part in the task
+    settings: Settings
+
+    def get_tags(self) -> dict:
+        return dict(goal=self.goal_id, task=self.task_index, team=self.team_id)
+
+    def get_name(self) -> str:
+        return f"{self.goal_id}/{self.task.get_scenario_name()}/{self.team_id}"
+
+
+class JobResult(BaseModel):
+    job_id: int
+    name: str
+    total_reward: Optional[float] = None
+    total_time: Optional[float] = None
+    n_episodes: Optional[int] = None
+    mean_episode_length: Optional[float] = None
+    completion_step: Optional[int] = None
+    n_samples: Optional[int] = None
+    estimate: Optional[float] = None
+    interval: Optional[list[float]] = None
+    sweep: list[dict] = []  # Results of every (failure_probability, k_robustness) cell of a sweep
+    cached: bool = False
+    env_pool_stats: dict = {}
+    phase_histograms: dict = {}
+    trace_events: list = []
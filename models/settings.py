@@ -1,8 +1,62 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, root_validator
 
 
 class Settings(BaseModel):
     name: str
     render: bool = False
     save: bool = False
+    render_stride: int = 1  # Film every Nth step
+    render_max_resolution: Optional[int] = None  # Max width/height of the video in pixels
+    render_env_index: int = 0  # Vectorized environment that is filmed
+    render_queue_size: int = 32
     failure_probability: float = 0.0
+    run_mode: str = "fixed"  # fixed, early_stop or auto_reset
+    failure_model: str = "bernoulli"
+    failure_model_params: dict = {}
+    seed: Optional[int] = None
+    adaptive_ci_width: Optional[float] = None  # Robust jobs run rounds until the confidence interval is this narrow
+    adaptive_metric: str = "success"  # success or reward
+    adaptive_confidence: float = 0.95
+    adaptive_round_envs: int = 64
+    adaptive_max_rounds: int = 20
+    sweep_failure_probabilities: Optional[list[float]] = None
+    sweep_k_robustness: Optional[list[int]] = None
+    sweep_envs_per_cell: int = 32
+    generate_teams: bool = False  # Add the teams found by the team formation solver
+    team_max_cost: Optional[float] = None
+    team_max_size: int = 10
+    team_k_robustness: int = 0
+    team_top_n: Optional[int] = None  # Cheapest teams kept per goal
+    auto_tune_num_envs: bool = False  # Probe and cache the fastest num_envs per scenario and team size
+    tuning_memory_ceiling_mb: float = 2048.0
+    tuning_probe_steps: int = 20
+    rllib_mode: str = "train"  # train or inference
+    rllib_concurrent_trials: bool = True  # Train all the RLlib jobs as the trials of a single Tune experiment
+    rllib_num_envs_per_worker: int = 96  # VMAS environments vectorized in every rollout worker
+    rllib_num_workers: int = 5
+    policy_store_dir: Optional[str] = ".tfm_cache/policies"  # None trains every RLlib job from scratch
+    warm_start_iterations: int = 500
+    compile_policies: bool = False  # Trace the heuristic policies with TorchScript
+    workers: int = 1
+    torch_threads_per_worker: int = 1
+    schedule_order: str = "default"  # default, longest_first or by_scenario
+    trace_path: Optional[str] = None  # Chrome trace-event JSON of the whole run, timing each simulation phase
+    metrics_dir: Optional[str] = None  # Per-step rewards, dones and active agents of every job are saved here
+    trajectory_dir: Optional[str] = None  # Entity trajectories of trajectory_envs, to render videos later
+    trajectory_envs: list[int] = [0]
+    result_cache_dir: Optional[str] = None  # Stored job results, jobs with a stored result are not run again
+    env_pool_memory_mb: float = 512.0  # 0 disables the reuse of built environments
+
+    @root_validator(skip_on_failure=True)
+    def check_sweep(cls, values):
+        is_sweep = values["sweep_failure_probabilities"] is not None or values["sweep_k_robustness"] is not None
+        if is_sweep and values["adaptive_ci_width"] is not None:
+            raise ValueError("Sweeps and adaptive stopping cannot be combined")
+        if values["sweep_failure_probabilities"] is not None and values["failure_model"] != "bernoulli":
+            raise ValueError("Only the bernoulli failure model can sweep failure probabilities")
+        return values
+
+    def is_sweep(self) -> bool:
+        return self.sweep_failure_probabilities is not None or self.sweep_k_robustness is not None
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from collections import Counter
+
+from pydantic import BaseModel, PrivateAttr, root_validator
 
 from models.settings import Settings
 from models.agent import Agent
@@ -12,13 +14,53 @@ class Simulation(BaseModel):
     teams: list[Team]
     goals: list[Goal]
 
-    def get_agents_of_team(self, team_id):
-        agents_ids = [agent_id for team in self.teams if team.id == team_id for agent_id in team.agents]
+    _agents_by_id: dict = PrivateAttr(default_factory=dict)
+    _agents_by_team: dict = PrivateAttr(default_factory=dict)
+    _agents_by_skill: dict = PrivateAttr(default_factory=dict)
+
+    @root_validator(skip_on_failure=True)
+    def check_team_agents(cls, values):
+        for name in ("agents", "teams", "goals"):
+            id_counts = Counter(item.id for item in values[name])
+            duplicate_ids = sorted(item_id for item_id, count in id_counts.items() if count > 1)
+            if duplicate_ids:
+                raise ValueError(f"Duplicate {name} ids {duplicate_ids}")
+        agent_ids = {agent.id for agent in values["agents"]}
+        for team in values["teams"]:
+            unknown_ids = [agent_id for agent_id in team.agents if agent_id not in agent_ids]
+            if unknown_ids:
+                raise ValueError(f"Team '{team.id}' uses unknown agents {unknown_ids}")
+        return values
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self._build_indexes()
+
+    def _build_indexes(self):
+        self._agents_by_id = {agent.id: agent for agent in self.agents}
+        self._agents_by_team = {
+            team.id: [self._agents_by_id[agent_id] for agent_id in team.agents] for team in self.teams
+        }
+        self._agents_by_skill = {}
+        for agent in self.agents:
+            for skill in agent.skills:
+                self._agents_by_skill.setdefault(skill, set()).add(agent.id)
+
+    def add_teams(self, teams: list[Team]):
+        # Assignment is not validated, an id collision would silently replace the agents of a team
+        self.check_team_agents(dict(agents=self.agents, teams=self.teams + teams, goals=self.goals))
+        self.teams = self.teams + teams
+        self._build_indexes()
+
+    def get_agent(self, agent_id) -> Agent:
+        return self._agents_by_id[agent_id]
+
+    def get_agents_of_team(self, team_id) -> list[Agent]:
+        return self._agents_by_team.get(team_id, [])
 
-        agents = []
-        for agent_id in agents_ids:
-            for agent in self.agents:
-                if agent.id == agent_id:
-                    agents.append(agent)
+    def get_agents_with_skill(self, skill) -> set[str]:
+        return self._agents_by_skill.get(skill, set())
 
-        return agents
+    def get_agents_of_team_for_task(self, team_id, task) -> list[Agent]:
+        agent_ids = self.get_agents_with_skill(task.environment)
+        return [agent for agent in self.get_agents_of_team(team_id) if agent.id in agent_ids]
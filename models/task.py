@@ -1,9 +1,12 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
 class Task(BaseModel):
     environment: str
     env_kwargs: dict = {}
+    checkpoint: Optional[str] = None  # Trained RLlib policy evaluated in inference mode
 
     def can_complete(self, agent_skills):
         return self.environment in agent_skills
@@ -2,22 +2,25 @@ import copy
 
 from pydantic import BaseModel
 
+from models.agent import Agent
+
 
 class Team(BaseModel):
     id: str
-    agents = [str]
-    k_robustness = 0
+    agents: list[str]
+    k_robustness: int = 0
 
-    def get_cost(self):
-        return sum([agent.get_cost() for agent in self.agents])
+    # agents are the resolved Agent models of the team, e.g. from Simulation.get_agents_of_team
+    def get_cost(self, agents: list[Agent]):
+        return sum([agent.get_cost() for agent in agents])
 
     # is said to be c-costly if the cost of T is less than c
-    def is_affordable(self, c):
-        return self.get_cost() <= c
+    def is_affordable(self, c, agents: list[Agent]):
+        return self.get_cost(agents) <= c
 
     # is said to be efficient with respect to G if T can accomplish G
-    def is_efficient(self, goal):
-        return all([goal.can_complete_task(agent) for agent in self.agents])
+    def is_efficient(self, goal, agents: list[Agent]):
+        return all([any([task.can_complete(agent.skills) for agent in agents]) for task in goal.tasks])
 
     def get_env_arguments(self, env_params):
         env_arguments = copy.deepcopy(env_params)
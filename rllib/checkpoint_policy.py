@@ -0,0 +1,95 @@
+import glob
+import io
+import os
+import pickle
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from core.policy_provider import BatchedPolicy
+
+
+class _Placeholder:
+    # Stands in for the Ray objects of a checkpoint, only its plain weights are needed
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __setstate__(self, state):
+        pass
+
+
+class _RayFreeUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module.split(".")[0] == "ray":
+            return _Placeholder
+        return super().find_class(module, name)
+
+
+def _unpickle(data: bytes):
+    return _RayFreeUnpickler(io.BytesIO(data)).load()
+
+
+def load_policy_weights(checkpoint, policy_id="default_policy") -> dict:
+    # Supports both the policy_state.pkl layout of Ray >= 2.1 and the single checkpoint-N file of older versions
+    policy_states = glob.glob(os.path.join(checkpoint, "**", policy_id, "policy_state.pkl"), recursive=True)
+    if os.path.isdir(checkpoint) and len(policy_states) > 0:
+        with open(sorted(policy_states)[-1], 'rb') as state_file:
+            state = _unpickle(state_file.read())
+    else:
+        if os.path.isfile(checkpoint):
+            checkpoint_path = checkpoint
+        else:
+            checkpoint_paths = [
+                path for path in glob.glob(os.path.join(checkpoint, "**", "checkpoint-*"), recursive=True)
+                if not path.endswith(".tune_metadata")
+            ]
+            if len(checkpoint_paths) == 0:
+                raise FileNotFoundError(f"No RLlib checkpoint found in '{checkpoint}'")
+            checkpoint_path = sorted(checkpoint_paths)[-1]
+        with open(checkpoint_path, 'rb') as checkpoint_file:
+            worker = _unpickle(_unpickle(checkpoint_file.read())["worker"])
+        state = worker["state"][policy_id]
+
+    weights = state.get("weights", state)
+    return {
+        key: torch.as_tensor(np.asarray(value), dtype=torch.float32)
+        for key, value in weights.items()
+        if key.startswith("_hidden_layers") or key.startswith("_logits")
+    }
+
+
+class CheckpointPolicy(BatchedPolicy):
+    # RLlib's default fully connected PPO model, run on every environment in one batched forward pass.
+    # The observations of all the agents are concatenated, and the logits hold a (mean, log_std) pair per agent.
+    def __init__(self, weights: dict, device="cpu"):
+        n_hidden_layers = len([key for key in weights if key.startswith("_hidden_layers") and key.endswith("weight")])
+        self.hidden_layers = [
+            (
+                weights[f"_hidden_layers.{i}._model.0.weight"].to(device),
+                weights[f"_hidden_layers.{i}._model.0.bias"].to(device),
+            )
+            for i in range(n_hidden_layers)
+        ]
+        self.logits = (weights["_logits._model.0.weight"].to(device), weights["_logits._model.0.bias"].to(device))
+
+    @classmethod
+    def load(cls, checkpoint, device="cpu"):
+        return cls(load_policy_weights(checkpoint), device)
+
+    @torch.no_grad()
+    def compute_actions(self, observations, u_ranges, active_agents=None):
+        n_agents = len(observations)
+        x = torch.cat([observation.flatten(1) for observation in observations], dim=-1)
+        for weight, bias in self.hidden_layers:
+            x = torch.tanh(F.linear(x, weight, bias))
+        logits = F.linear(x, *self.logits)
+
+        # The deterministic action is the mean, unsquashed from [-1, 1] to the action range as RLlib does
+        action_size = logits.shape[-1] // (2 * n_agents)
+        means = logits.view(-1, n_agents, 2 * action_size)[..., :action_size]
+        u_range = torch.tensor(u_ranges, dtype=means.dtype, device=means.device).view(1, n_agents, 1)
+        actions = means.clamp(-1, 1) * u_range
+        if active_agents is not None:
+            actions = actions * active_agents.unsqueeze(-1)
+        return list(actions.unbind(1))
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import shutil
+
+
+class PolicyStore:
+    # Trained checkpoints, one directory per (scenario, n_agents, k_robustness, failure_probability, config hash)
+    def __init__(self, root=".tfm_cache/policies"):
+        self.root = root
+        self.hits = 0
+        self.warm_starts = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_config_hash(config: dict) -> str:
+        return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def get_key(scenario, n_agents, k_robustness, failure_probability, config_hash) -> str:
+        return f"{scenario}_n{n_agents}_k{k_robustness}_p{failure_probability:g}_{config_hash}"
+
+    def find(self, scenario, n_agents, k_robustness, failure_probability, config_hash=None):
+        # Returns (entry, exact): the entry of an identical policy, or else the closest one it can warm-start from.
+        # Without config_hash, policies trained with any config match.
+        if config_hash is not None:
+            entry = self._read_entry(self.get_key(scenario, n_agents, k_robustness, failure_probability, config_hash))
+            if entry is not None:
+                self.hits += 1
+                return entry, True
+
+        # The model input grows with the number of agents, so only failure settings may differ
+        candidates = [
+            entry for entry in self._read_entries()
+            if entry["scenario"] == scenario and entry["n_agents"] == n_agents
+            and (config_hash is None or entry["config_hash"] == config_hash)
+        ]
+        if len(candidates) == 0:
+            self.misses += 1
+            return None, False
+
+        entry = min(candidates, key=lambda entry: (
+            abs(entry["k_robustness"] - k_robustness),
+            abs(entry["failure_probability"] - failure_probability),
+        ))
+        if entry["k_robustness"] == k_robustness and entry["failure_probability"] == failure_probability:
+            self.hits += 1
+            return entry, True
+        self.warm_starts += 1
+        return entry, False
+
+    def add(self, scenario, n_agents, k_robustness, failure_probability, config_hash, checkpoint_dir, training_iteration):
+        key = self.get_key(scenario, n_agents, k_robustness, failure_probability, config_hash)
+        entry_dir = os.path.join(self.root, key)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        # The checkpoint is copied so that it outlives the Tune trial directory
+        shutil.copytree(checkpoint_dir, os.path.join(entry_dir, "checkpoint"))
+
+        entry = {
+            "scenario": scenario,
+            "n_agents": n_agents,
+            "k_robustness": k_robustness,
+            "failure_probability": failure_probability,
+            "config_hash": config_hash,
+            "checkpoint": os.path.join(entry_dir, "checkpoint"),
+            "training_iteration": training_iteration,
+        }
+        with open(os.path.join(entry_dir, "entry.json"), 'w') as entry_file:
+            json.dump(entry, entry_file, indent=2)
+        return entry
+
+    def get_stats(self) -> dict:
+        return {"hits": self.hits, "warm_starts": self.warm_starts, "misses": self.misses}
+
+    def _read_entry(self, key):
+        entry_path = os.path.join(self.root, key, "entry.json")
+        if not os.path.exists(entry_path):
+            return None
+        with open(entry_path, 'r') as entry_file:
+            entry = json.load(entry_file)
+        return entry if os.path.exists(entry["checkpoint"]) else None
+
+    def _read_entries(self):
+        if not os.path.isdir(self.root):
+            return []
+        entries = [self._read_entry(key) for key in sorted(os.listdir(self.root))]
+        return [entry for entry in entries if entry is not None]
@@ -13,11 +13,12 @@ from ray.rllib.utils.typing import PolicyID
 from ray.tune import register_env
 from ray.tune.integration.wandb import WandbLoggerCallback
 from vmas import make_env, Wrapper
-from vmas.examples.rllib import RenderingCallbacks, EvaluationCallbacks
 
+from core.tracing import tracer
+from rllib.policy_store import PolicyStore
 from rllib.vector_env_wrapper_robust import VectorEnvWrapperRobust
 
-supported_environments = ["balance", "ball_trajectory", "discovery", "dispersion"]
+TRAINING_ITERATIONS = 5000
 
 
 def env_creator_robust(config: Dict):
@@ -35,10 +36,22 @@ def env_creator_robust(config: Dict):
 
 
 class RLlibEnvironment:
-    def __init__(self, scenario_name, n_agents: int, k_robustness: int = 0, failure_probability: float = 0.0):
+    def __init__(
+            self,
+            scenario_name,
+            n_agents: int,
+            k_robustness: int = 0,
+            failure_probability: float = 0.0,
+            num_vectorized_envs: int = 96,
+            num_workers: int = 5,
+            policy_store: Optional[PolicyStore] = None,
+            warm_start_iterations: int = 500,
+            render_stride: int = 1,
+            auto_train: bool = True,
+    ):
         self.n_agents = n_agents
-        self.num_vectorized_envs = 96
-        self.num_workers = 5
+        self.num_vectorized_envs = num_vectorized_envs
+        self.num_workers = num_workers
         self.vmas_device = "cpu"
         self.continuous_actions = True
         self.max_steps = 200
@@ -46,17 +59,46 @@ class RLlibEnvironment:
         self.scenario_name = scenario_name
         self.k_robustness = k_robustness
         self.failure_probability = failure_probability
+        self.policy_store = policy_store
+        self.warm_start_iterations = warm_start_iterations
+        self.render_stride = render_stride
+        self.checkpoint = None
 
         self.initialize()
-        self.train()
+        if auto_train:
+            self.train()
 
     def initialize(self):
         if not ray.is_initialized():
-            ray.init()
+            with tracer.span("ray_init", "setup"):
+                ray.init()
             print("Ray init robust!")
         register_env(f"tfm_{self.scenario_name}", lambda config: env_creator_robust(config))
 
     class EvaluationCallbacks(DefaultCallbacks):
+        # Info values are written into per-episode buffers of max_steps rows that are reused across episodes
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.keys = None
+            self.metric_names = None
+            self.sums = None
+            self.free_buffers = []
+
+        def on_episode_start(
+                self,
+                *,
+                worker: RolloutWorker,
+                base_env: BaseEnv,
+                policies: Dict[str, Policy],
+                episode: MultiAgentEpisode,
+                **kwargs,
+        ):
+            if len(self.free_buffers) > 0:
+                episode.user_data["buffer"] = self.free_buffers.pop()
+            else:
+                episode.user_data["buffer"] = None  # Allocated at the first step, once the info keys are known
+            episode.user_data["length"] = 0
+
         def on_episode_step(
                 self,
                 *,
@@ -66,12 +108,20 @@ class RLlibEnvironment:
                 **kwargs,
         ):
             info = episode.last_info_for()
-            for a_key in info.keys():
-                for b_key in info[a_key]:
-                    try:
-                        episode.user_data[f"{a_key}/{b_key}"].append(info[a_key][b_key])
-                    except KeyError:
-                        episode.user_data[f"{a_key}/{b_key}"] = [info[a_key][b_key]]
+            if self.keys is None:
+                self.keys = [(a_key, b_key) for a_key in info.keys() for b_key in info[a_key]]
+                self.metric_names = [f"{a_key}/{b_key}" for a_key, b_key in self.keys]
+                self.sums = np.zeros(len(self.keys))
+
+            buffer, length = episode.user_data["buffer"], episode.user_data["length"]
+            if buffer is None:
+                buffer = np.zeros((worker.env_context.get("max_steps") or 200, len(self.keys)))
+            elif length == len(buffer):
+                buffer = np.concatenate([buffer, np.zeros_like(buffer)])
+            row = buffer[length]
+            for i, (a_key, b_key) in enumerate(self.keys):
+                row[i] = info[a_key][b_key]
+            episode.user_data["buffer"], episode.user_data["length"] = buffer, length + 1
 
         def on_episode_end(
                 self,
@@ -82,16 +132,21 @@ class RLlibEnvironment:
                 episode: MultiAgentEpisode,
                 **kwargs,
         ):
-            info = episode.last_info_for()
-            for a_key in info.keys():
-                for b_key in info[a_key]:
-                    metric = np.array(episode.user_data[f"{a_key}/{b_key}"])
-                    episode.custom_metrics[f"{a_key}/{b_key}"] = np.sum(metric).item()
+            buffer, length = episode.user_data["buffer"], episode.user_data["length"]
+            if buffer is None:
+                return
+            np.sum(buffer[:length], axis=0, out=self.sums)
+            for metric_name, metric in zip(self.metric_names, self.sums):
+                episode.custom_metrics[metric_name] = metric.item()
+            self.free_buffers.append(buffer)
 
     class RenderingCallbacks(DefaultCallbacks):
+        # Every render_stride-th frame is written in place into a (T, C, H, W) buffer allocated once
         def __init__(self, *args, **kwargs):
             super().__init__(*args, **kwargs)
-            self.frames = []
+            self.frames = None
+            self.n_frames = 0
+            self.step = 0
 
         def on_episode_step(
                 self,
@@ -102,7 +157,17 @@ class RLlibEnvironment:
                 episode: Episode,
                 **kwargs,
         ) -> None:
-            self.frames.append(base_env.vector_env.try_render_at(mode="rgb_array"))
+            stride = worker.env_context.get("render_stride", 1)
+            self.step += 1
+            if (self.step - 1) % stride != 0:
+                return
+            frame = base_env.vector_env.try_render_at(mode="rgb_array")
+            if self.frames is None:
+                max_frames = -(-(worker.env_context.get("max_steps") or 200) // stride)
+                self.frames = np.zeros((max_frames,) + frame.shape[2:] + frame.shape[:2], dtype=frame.dtype)
+            if self.n_frames < len(self.frames):
+                self.frames[self.n_frames] = np.moveaxis(frame, 2, 0)
+                self.n_frames += 1
 
         def on_episode_end(
                 self,
@@ -113,81 +178,162 @@ class RLlibEnvironment:
                 episode: Episode,
                 **kwargs,
         ) -> None:
-            vid = np.transpose(self.frames, (0, 3, 1, 2))
-            episode.media["rendering"] = wandb.Video(
-                vid, fps=1 / base_env.vector_env.env.world.dt, format="mp4"
-            )
-            self.frames = []
+            if self.n_frames > 0:
+                stride = worker.env_context.get("render_stride", 1)
+                episode.media["rendering"] = wandb.Video(
+                    self.frames[:self.n_frames], fps=1 / base_env.vector_env.env.world.dt / stride, format="mp4"
+                )
+            self.n_frames = 0
+            self.step = 0
 
     def train(self):
+        # Returns the trained trial, None when a stored policy is reused as it is
+        entry, exact = self.find_stored_policy()
+        if exact:
+            return None
+
+        config = self.get_config(*self.get_gpus())
+        with tracer.span(
+                "tune_run", "training", scenario=self.scenario_name, n_agents=self.n_agents, warm_start=entry is not None
+        ):
+            if entry is None:
+                analysis = self.tune_run(config, TRAINING_ITERATIONS, project=self.scenario_name)
+            else:
+                # A policy trained with other failure settings only needs fine-tuning
+                print(f"Warm-starting from {entry['checkpoint']}")
+                analysis = self.tune_run(
+                    config,
+                    entry["training_iteration"] + self.warm_start_iterations,
+                    project=self.scenario_name,
+                    restore=entry["checkpoint"],
+                )
+        self.store_checkpoint(analysis, analysis.trials[0])
+        return analysis.trials[0]
+
+    def get_gpus(self):
         RLLIB_NUM_GPUS = int(os.environ.get("RLLIB_NUM_GPUS", "0"))
         num_gpus = 0.001 if RLLIB_NUM_GPUS > 0 else 0  # Driver GPU
         num_gpus_per_worker = (
             (RLLIB_NUM_GPUS - num_gpus) / (self.num_workers + 1) if self.vmas_device == "cuda" else 0
         )
+        return num_gpus, num_gpus_per_worker
+
+    def find_stored_policy(self):
+        if self.policy_store is None:
+            return None, False
+        entry, exact = self.policy_store.find(
+            self.scenario_name, self.n_agents, self.k_robustness, self.failure_probability, self._get_config_hash()
+        )
+        if exact:
+            print(f"Reusing trained policy {entry['checkpoint']}")
+            self.checkpoint = entry["checkpoint"]
+        return entry, exact
+
+    def store_checkpoint(self, analysis, trial):
+        checkpoint = analysis.get_last_checkpoint(trial)
+        if checkpoint is None:
+            return
+        checkpoint_dir = checkpoint if isinstance(checkpoint, str) else checkpoint.to_directory()
+        if os.path.isfile(checkpoint_dir):
+            checkpoint_dir = os.path.dirname(checkpoint_dir)
+        self.checkpoint = checkpoint_dir
+
+        if self.policy_store is not None:
+            entry = self.policy_store.add(
+                self.scenario_name,
+                self.n_agents,
+                self.k_robustness,
+                self.failure_probability,
+                self._get_config_hash(),
+                checkpoint_dir,
+                trial.last_result["training_iteration"],
+            )
+            self.checkpoint = entry["checkpoint"]
+
+    def _get_config_hash(self):
+        # Only what changes the learned policy; resources, callbacks and per-team settings are left out
+        config = self.get_config(0, 0)
+        env_config = config.pop("env_config")
+        for key in ["num_gpus", "num_workers", "num_gpus_per_worker", "num_envs_per_worker", "callbacks",
+                    "evaluation_config"]:
+            config.pop(key)
+        config["max_steps"] = env_config["max_steps"]
+        config["continuous_actions"] = env_config["continuous_actions"]
+        return PolicyStore.get_config_hash(config)
 
-        tune.run(
+    @staticmethod
+    def tune_run(config, training_iterations, project, restore=None, raise_on_failed_trial=True):
+        return tune.run(
             PPOTrainer,
-            stop={"training_iteration": 5000},
+            raise_on_failed_trial=raise_on_failed_trial,
+            stop={"training_iteration": training_iterations},
             checkpoint_freq=1,
             keep_checkpoints_num=2,
             checkpoint_at_end=True,
             checkpoint_score_attr="episode_reward_mean",
+            restore=restore,
             callbacks=[
                 WandbLoggerCallback(
-                    project=f"{self.scenario_name}",
+                    project=project,
                     api_key="",
                 )
             ],
-            config={
-                "seed": 0,
-                "framework": "torch",
-                "env": f"tfm_{self.scenario_name}",
-                "kl_coeff": 0.01,
-                "kl_target": 0.01,
-                "lambda": 0.9,
-                "clip_param": 0.2,
-                "vf_loss_coeff": 1,
-                "vf_clip_param": float("inf"),
-                "entropy_coeff": 0,
-                "train_batch_size": 60000,
-                "rollout_fragment_length": 125,
-                # "sgd_minibatch_size": 10,
-                "sgd_minibatch_size": 4096,
-                "num_sgd_iter": 40,
-                "num_gpus": num_gpus,
-                "num_workers": self.num_workers,
-                "num_gpus_per_worker": num_gpus_per_worker,
-                "num_envs_per_worker": self.num_vectorized_envs,
-                "lr": 5e-5,
-                "gamma": 0.99,
-                "use_gae": True,
-                "use_critic": True,
-                "batch_mode": "truncate_episodes",
+            config=config,
+        )
+
+    def get_env_config(self):
+        return {
+            "device": self.vmas_device,
+            "num_envs": self.num_vectorized_envs,
+            "scenario_name": self.scenario_name,
+            "continuous_actions": self.continuous_actions,
+            "max_steps": self.max_steps,
+            # Scenario specific variables
+            "scenario_config": {
+                "n_agents": self.n_agents,
+                "k_robustness": self.k_robustness,
+                "failure_probability": self.failure_probability,
+            },
+        }
+
+    def get_config(self, num_gpus, num_gpus_per_worker):
+        return {
+            "seed": 0,
+            "framework": "torch",
+            "env": f"tfm_{self.scenario_name}",
+            "kl_coeff": 0.01,
+            "kl_target": 0.01,
+            "lambda": 0.9,
+            "clip_param": 0.2,
+            "vf_loss_coeff": 1,
+            "vf_clip_param": float("inf"),
+            "entropy_coeff": 0,
+            "train_batch_size": 60000,
+            "rollout_fragment_length": 125,
+            # "sgd_minibatch_size": 10,
+            "sgd_minibatch_size": 4096,
+            "num_sgd_iter": 40,
+            "num_gpus": num_gpus,
+            "num_workers": self.num_workers,
+            "num_gpus_per_worker": num_gpus_per_worker,
+            "num_envs_per_worker": self.num_vectorized_envs,
+            "lr": 5e-5,
+            "gamma": 0.99,
+            "use_gae": True,
+            "use_critic": True,
+            "batch_mode": "truncate_episodes",
+            "env_config": self.get_env_config(),
+            "evaluation_interval": 5,
+            "evaluation_duration": 1,
+            "evaluation_num_workers": 1,
+            "evaluation_parallel_to_training": True,
+            "evaluation_config": {
+                "num_envs_per_worker": 1,
                 "env_config": {
-                    "device": self.vmas_device,
-                    "num_envs": self.num_vectorized_envs,
-                    "scenario_name": self.scenario_name,
-                    "continuous_actions": self.continuous_actions,
-                    "max_steps": self.max_steps,
-                    # Scenario specific variables
-                    "scenario_config": {
-                        "n_agents": self.n_agents,
-                        "k_robustness": self.k_robustness,
-                        "failure_probability": self.failure_probability,
-                    },
+                    "num_envs": 1,
+                    "render_stride": self.render_stride,
                 },
-                "evaluation_interval": 5,
-                "evaluation_duration": 1,
-                "evaluation_num_workers": 1,
-                "evaluation_parallel_to_training": True,
-                "evaluation_config": {
-                    "num_envs_per_worker": 1,
-                    "env_config": {
-                        "num_envs": 1,
-                    },
-                    "callbacks": MultiCallbacks([RenderingCallbacks, EvaluationCallbacks]),
-                },
-                "callbacks": EvaluationCallbacks,
+                "callbacks": MultiCallbacks([self.RenderingCallbacks, self.EvaluationCallbacks]),
             },
-        )
+            "callbacks": self.EvaluationCallbacks,
+        }
@@ -0,0 +1,79 @@
+from typing import Dict
+
+from ray import tune
+from ray.tune import register_env
+
+from core.tracing import tracer
+from rllib.rllib_environment import RLlibEnvironment, TRAINING_ITERATIONS, env_creator_robust
+
+
+class RLlibExperiment:
+    # Trains the policies of many teams as the trials of one Tune experiment, so that Tune runs them concurrently
+    # on the available CPUs with a single Ray runtime. Teams with the same training setup share a trial.
+    def __init__(self, name, environments: Dict[int, RLlibEnvironment]):
+        self.name = name
+        self.environments = environments  # Job id -> environment created with auto_train=False
+        self.results = {}
+
+    def run(self) -> Dict[int, dict]:
+        env_configs, keys_by_trial, warm_start_keys = [], [], []
+        first_environment = next(iter(self.environments.values()))
+        for key, environment in self.environments.items():
+            entry, exact = environment.find_stored_policy()
+            if exact:
+                self.results[key] = dict(checkpoint=environment.checkpoint)
+                continue
+            if entry is not None:
+                warm_start_keys.append(key)
+                continue
+            # RLlib expects every sub-environment of a worker to hold num_envs_per_worker VMAS environments
+            env_config = dict(environment.get_env_config(), num_envs=first_environment.num_vectorized_envs)
+            if env_config in env_configs:
+                keys_by_trial[env_configs.index(env_config)].append(key)
+            else:
+                env_configs.append(env_config)
+                keys_by_trial.append([key])
+        if len(env_configs) > 0:
+            self._run_trials(first_environment, env_configs, keys_by_trial)
+
+        # A stored policy with other failure settings is restored and only fine-tuned, which a grid search trial
+        # cannot do since every trial starts from the same weights
+        for key in warm_start_keys:
+            environment = self.environments[key]
+            try:
+                trial = environment.train()
+            except Exception as error:
+                self.results[key] = dict(error=f"Warm-started training failed: {error!r}")
+            else:
+                self.results[key] = self._get_result(environment, trial) if trial is not None \
+                    else dict(checkpoint=environment.checkpoint)
+        return self.results
+
+    def _run_trials(self, first_environment, env_configs, keys_by_trial):
+        register_env("tfm", env_creator_robust)
+        config = first_environment.get_config(*first_environment.get_gpus())
+        config["env"] = "tfm"
+        config["env_config"] = tune.grid_search(env_configs)
+
+        with tracer.span("tune_run", "training", trials=len(env_configs)):
+            # A failed trial only fails the teams it trains, the other trials are still stored and reported
+            analysis = RLlibEnvironment.tune_run(
+                config, TRAINING_ITERATIONS, project=self.name, raise_on_failed_trial=False
+            )
+
+        for trial in analysis.trials:
+            for key in keys_by_trial[env_configs.index(trial.config["env_config"])]:
+                environment = self.environments[key]
+                if trial.status != "TERMINATED":
+                    self.results[key] = dict(error=f"Trial {trial} ended as {trial.status}, see {trial.error_file}")
+                    continue
+                environment.store_checkpoint(analysis, trial)
+                self.results[key] = self._get_result(environment, trial)
+
+    @staticmethod
+    def _get_result(environment, trial):
+        return dict(
+            total_reward=trial.last_result.get("episode_reward_mean"),
+            total_time=trial.last_result.get("time_total_s"),
+            checkpoint=environment.checkpoint,
+        )
@@ -0,0 +1,100 @@
+from typing import List
+
+import numpy as np
+import torch
+
+
+# Failure sampling and action conversion of VectorEnvWrapperRobust, kept free of Ray so they can be checked alone
+
+def sample_failed_agents(failed_agents, k_robustness: int, failure_probability_per_step: float):
+    # Compute for all environments at once, an agent fails based on probability if not enough agents failed
+    num_envs, n_agents = failed_agents.shape
+    can_fail = failed_agents.sum(dim=1) < k_robustness
+    fails = torch.rand(num_envs, device=failed_agents.device) <= failure_probability_per_step
+    env_indexes = torch.nonzero(can_fail & fails).squeeze(-1)
+    if len(env_indexes) > 0:
+        # Choose random agent, if it has already failed this is a no-op
+        failed_agent_indexes = torch.randint(max(n_agents - 1, 1), (len(env_indexes),), device=failed_agents.device)
+        failed_agents[env_indexes, failed_agent_indexes] = True
+
+
+def check_action_shapes(list_in: List, env):
+    assert len(list_in) == env.num_envs, "Input action is not in correct format"
+    for j in range(env.num_envs):
+        assert (
+                len(list_in[j]) == env.n_agents
+        ), f"Expecting actions for {env.n_agents} agents, got {len(list_in[j])} actions"
+    for i, agent in enumerate(env.agents):
+        act_shape = np.shape(list_in[0][i])
+        action_size = env.get_agent_action_size(agent)
+        if len(act_shape) == 0:
+            assert action_size == 1, f"Action of agent {i} is supposed to be an scalar int"
+        else:
+            assert len(act_shape) == 1 and act_shape[0] == action_size, (
+                f"Action of agent {i} hase wrong shape: expected {action_size}, got {act_shape[0]}"
+            )
+
+
+def actions_to_tensor_vectorized(list_in: List, env, failed_agents) -> List:
+    assert len(list_in) == env.num_envs, "Input action is not in correct format"
+    # Skip actions/movements of failed agents by zeroing them
+    active = (~failed_agents).unsqueeze(-1)
+    action_sizes = {env.get_agent_action_size(agent) for agent in env.agents}
+    if len(action_sizes) == 1:
+        actions = torch.as_tensor(
+            np.asarray(list_in, dtype=np.float32), device=env.device
+        ).reshape(env.num_envs, env.n_agents, -1)
+        return list((actions * active).unbind(dim=1))
+
+    actions = []
+    for i in range(env.n_agents):
+        act = torch.as_tensor(
+            np.asarray([list_in[j][i] for j in range(env.num_envs)], dtype=np.float32),
+            device=env.device,
+        ).reshape(env.num_envs, -1)
+        actions.append(act * active[:, i])
+    return actions
+
+
+def actions_to_tensor_per_env(list_in: List, env, failed_agents) -> List:
+    if len(list_in) == env.num_envs:
+        actions = []
+        for agent in env.agents:
+            actions.append(
+                torch.zeros(
+                    env.num_envs,
+                    env.get_agent_action_size(agent),
+                    device=env.device,
+                    dtype=torch.float32,
+                )
+            )
+        failed_agents = failed_agents.tolist()
+        for j in range(env.num_envs):
+            assert (
+                    len(list_in[j]) == env.n_agents
+            ), f"Expecting actions for {env.n_agents} agents, got {len(list_in[j])} actions"
+            for i in range(env.n_agents):
+                # Here start the changes from base class
+                # Skip actions/movements of failed agents
+                if failed_agents[j][i]:
+                    continue
+                # Here end the changes from base class
+
+                act = torch.tensor(
+                    list_in[j][i], dtype=torch.float32, device=env.device
+                )
+                if len(act.shape) == 0:
+                    assert (
+                            env.get_agent_action_size(env.agents[i]) == 1
+                    ), f"Action of agent {i} in env {j} is supposed to be an scalar int"
+                else:
+                    assert len(act.shape) == 1 and act.shape[
+                        0
+                    ] == env.get_agent_action_size(env.agents[i]), (
+                        f"Action of agent {i} in env {j} hase wrong shape: "
+                        f"expected {env.get_agent_action_size(env.agents[i])}, got {act.shape[0]}"
+                    )
+                actions[i][j] = act
+        return actions
+    else:
+        assert False, "Input action is not in correct format"
@@ -0,0 +1,99 @@
+import math
+
+import pytest
+import torch
+
+from environments.failure_schedule import BernoulliHazard, FailureSchedule, make_generator, make_hazard_model
+from models.settings import Settings
+
+NUM_ENVS = 512
+N_AGENTS = 4
+N_STEPS = 200
+
+
+def make_schedule(k_robustness, failure_probability=5.0, seed=0, num_envs=NUM_ENVS):
+    return FailureSchedule(
+        hazard=make_hazard_model(Settings(name="test", failure_probability=failure_probability)),
+        num_envs=num_envs,
+        n_agents=N_AGENTS,
+        k_robustness=k_robustness,
+        generator=make_generator(seed),
+    )
+
+
+def run(schedule, n_steps=N_STEPS):
+    # Number of failed agents of every environment after each step
+    failed = []
+    for _ in range(n_steps):
+        schedule.step()
+        failed.append((~schedule.active()).sum(dim=1))
+    return torch.stack(failed)
+
+
+@pytest.mark.parametrize("k_robustness", [1, 2, 3])
+def test_at_most_k_agents_fail(k_robustness):
+    schedule = make_schedule(k_robustness)
+    schedule.reset()
+    failed = run(schedule)
+    assert failed.max() <= k_robustness
+    # With a high failure probability the cap is reached, not merely respected
+    assert (failed[-1] == k_robustness).float().mean() > 0.9
+
+
+def test_per_env_k_robustness():
+    k_robustness = torch.arange(NUM_ENVS) % N_AGENTS
+    schedule = make_schedule(k_robustness)
+    schedule.reset()
+    failed = run(schedule)
+    assert (failed <= k_robustness).all()
+
+
+@pytest.mark.parametrize("k_robustness", [0, N_AGENTS, N_AGENTS + 1])
+def test_no_failures_without_slack(k_robustness):
+    schedule = make_schedule(k_robustness)
+    schedule.reset()
+    assert run(schedule).max() == 0
+    assert torch.isinf(schedule.failure_steps).all()
+
+
+def test_reset_at_only_resamples_one_env():
+    schedule = make_schedule(2)
+    schedule.reset()
+    run(schedule, 10)
+    failure_steps = schedule.failure_steps.clone()
+    steps = schedule.steps.clone()
+
+    schedule.reset_at(3)
+    assert schedule.steps[3] == 0
+    assert schedule.steps[torch.arange(NUM_ENVS) != 3].eq(steps[torch.arange(NUM_ENVS) != 3]).all()
+    assert torch.equal(schedule.failure_steps[:3], failure_steps[:3])
+    assert torch.equal(schedule.failure_steps[4:], failure_steps[4:])
+    assert (schedule.failure_steps[3] < math.inf).sum() <= 2
+
+
+def test_same_seed_gives_same_failures():
+    schedules = [make_schedule(2, seed=7), make_schedule(2, seed=7)]
+    for schedule in schedules:
+        schedule.reset()
+    assert torch.equal(schedules[0].failure_steps, schedules[1].failure_steps)
+
+
+@pytest.mark.parametrize("failure_probability", [0.5, 2.0])
+def test_bernoulli_rate_matches_former_weights(failure_probability):
+    # The former per-step check failed an agent with probability p / 10
+    rate = failure_probability / 10
+    hazard = make_hazard_model(Settings(name="test", failure_probability=failure_probability))
+    failure_steps = hazard.sample((200_000,), make_generator(0))
+    # Maximum likelihood estimate of a geometric rate: failures over steps survived plus failures
+    empirical_rate = len(failure_steps) / (failure_steps.sum() + len(failure_steps))
+    assert empirical_rate == pytest.approx(rate, rel=0.02)
+
+
+def test_per_env_probabilities_match_scalar_rate():
+    probabilities = torch.tensor([0.0, 0.05, 0.2, 1.0]).repeat_interleave(50_000)
+    failure_steps = BernoulliHazard(probabilities).sample((len(probabilities), 1), make_generator(0))[:, 0]
+    assert torch.isinf(failure_steps[:50_000]).all()
+    assert (failure_steps[150_000:] == 0).all()
+    for i, rate in [(1, 0.05), (2, 0.2)]:
+        cell = failure_steps[i * 50_000:(i + 1) * 50_000]
+        assert len(cell) / (cell.sum() + len(cell)) == pytest.approx(rate, rel=0.03)
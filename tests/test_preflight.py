@@ -0,0 +1,54 @@
+import random
+
+from core.preflight import PreflightPlanner
+from models.simulation import Simulation
+
+SKILLS = ["transport", "wheel", "balance", "navigation"]
+
+
+def random_simulation(seed):
+    rng = random.Random(seed)
+    n_agents = rng.randint(1, 30)
+    return Simulation(
+        settings=dict(name="test"),
+        agents=[
+            dict(id=f"a{i}", cost=rng.randint(0, 5), skills=rng.sample(SKILLS, rng.randint(0, 3)))
+            for i in range(n_agents)
+        ],
+        teams=[
+            dict(id=f"t{i}", k_robustness=rng.randint(0, 2),
+                 agents=[f"a{rng.randrange(n_agents)}" for _ in range(rng.randint(1, 6))])
+            for i in range(rng.randint(1, 30))
+        ],
+        goals=[
+            dict(id=f"g{i}", tasks=[dict(environment=rng.choice(SKILLS)) for _ in range(rng.randint(1, 3))])
+            for i in range(3)
+        ],
+    )
+
+
+def test_plan_matches_the_simulation_indexes():
+    for seed in range(50):
+        simulation = random_simulation(seed)
+        plan = PreflightPlanner(simulation).get_plan()
+
+        expected = {
+            (goal.id, task_index, team.id): simulation.get_agents_of_team_for_task(team.id, task)
+            for goal in simulation.goals
+            for task_index, task in enumerate(goal.tasks)
+            for team in simulation.teams
+        }
+        planned = {(goal.id, task_index, team.id): agents for goal, task_index, _, team, agents in plan}
+        assert planned == {key: agents for key, agents in expected.items() if len(agents) > 0}
+
+
+def test_plan_orders_teams_by_cost():
+    simulation = random_simulation(0)
+    planner = PreflightPlanner(simulation)
+    team_indexes = {team.id: i for i, team in enumerate(simulation.teams)}
+    previous = None
+    for goal, task_index, _, team, _ in planner.get_plan():
+        current = (goal.id, task_index, planner.team_costs[team_indexes[team.id]])
+        if previous is not None and previous[:2] == current[:2]:
+            assert previous[2] <= current[2]
+        previous = current
@@ -0,0 +1,37 @@
+import pytest
+
+from environments.base_environment import BaseEnvironment
+from environments.environment_pool import EnvironmentPool
+from environments.robust_environment import RobustEnvironment
+from models.settings import Settings
+
+N_ENVS = 8
+N_STEPS = 40
+
+
+def run(settings, k_robustness, env_pool=None):
+    kwargs = dict(name="transport", n_agents=3, kwargs={"n_packages": 1}, settings=settings, env_pool=env_pool,
+                  n_envs=N_ENVS, n_steps=N_STEPS)
+    if k_robustness == 0:
+        return BaseEnvironment(**kwargs).total_reward
+    return RobustEnvironment(k_robustness=k_robustness, **kwargs).total_reward
+
+
+@pytest.mark.parametrize("k_robustness", [0, 1])
+def test_seeded_runs_are_identical(k_robustness):
+    settings = Settings(name="test", seed=3, failure_probability=5.0)
+    assert run(settings, k_robustness) == run(settings, k_robustness)
+
+
+def test_pooled_environment_is_reseeded():
+    settings = Settings(name="test", seed=3, failure_probability=5.0)
+    env_pool = EnvironmentPool(memory_budget_mb=512)
+    first = run(settings, 1, env_pool)
+    # Another job on the same pooled environment advances its random state
+    run(Settings(name="test", seed=3, run_mode="auto_reset"), 0, env_pool)
+    assert run(settings, 1, env_pool) == first
+    assert env_pool.hits == 2
+
+
+def test_seeds_change_the_initial_states():
+    assert run(Settings(name="test", seed=3), 0) != run(Settings(name="test", seed=4), 0)
@@ -0,0 +1,63 @@
+import itertools
+import math
+import random
+
+import pytest
+
+from core.team_formation import TeamFormationSolver
+from models.agent import Agent
+from models.goal import Goal
+from models.task import Task
+
+SKILLS = ["transport", "wheel", "balance"]
+
+
+def random_catalog(rng):
+    agents = [
+        Agent(id=f"a{i}", cost=rng.randint(0, 6), skills=rng.sample(SKILLS, rng.randint(0, 2)))
+        for i in range(rng.randint(1, 6))
+    ]
+    goal = Goal(id="g", tasks=[Task(environment=skill) for skill in rng.sample(SKILLS, rng.randint(1, 3))])
+    return agents, goal
+
+
+def brute_force_min_cost(agents, goal, k_robustness, max_size, max_cost):
+    # Cheapest multiset of agents that keeps every skill of the goal after any k_robustness failures
+    need = k_robustness + 1
+    skills = {task.environment for task in goal.tasks}
+    best = math.inf
+    for size in range(1, max_size + 1):
+        for team in itertools.combinations_with_replacement(agents, size):
+            if all(sum(skill in agent.skills for agent in team) >= need for skill in skills):
+                cost = sum(agent.get_cost() for agent in team)
+                if cost <= max_cost:
+                    best = min(best, cost)
+    return best
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_matches_brute_force(seed):
+    rng = random.Random(seed)
+    agents, goal = random_catalog(rng)
+    k_robustness = rng.randint(0, 1)
+    max_size = rng.randint(1, 4)
+    max_cost = rng.choice([None, 4, 8])
+
+    teams = TeamFormationSolver(agents, max_cost=max_cost, max_size=max_size, k_robustness=k_robustness).solve(goal)
+    expected = brute_force_min_cost(agents, goal, k_robustness, max_size, math.inf if max_cost is None else max_cost)
+    agents_by_id = {agent.id: agent for agent in agents}
+    costs = [sum(agents_by_id[agent_id].get_cost() for agent_id in team.agents) for team in teams]
+    assert (min(costs) if costs else math.inf) == expected
+
+
+def test_generated_ids_do_not_collide():
+    agents = [Agent(id="a1", skills=["transport"]), Agent(id="a2", skills=["transport"])]
+    goal = Goal(id="g1", tasks=[Task(environment="transport")])
+    solver = TeamFormationSolver(agents, prune_dominated=False)
+    generated_ids = [team.id for team in solver.solve(goal)]
+    assert all(team_id.startswith("gen_g1_") for team_id in generated_ids)
+
+    teams = solver.solve_all([goal], taken_ids=[generated_ids[0], "g1_team1"])
+    team_ids = [team.id for team in teams]
+    assert len(set(team_ids)) == len(team_ids)
+    assert generated_ids[0] not in team_ids and "g1_team1" not in team_ids
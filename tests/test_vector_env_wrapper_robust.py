@@ -0,0 +1,62 @@
+import numpy as np
+import torch
+from vmas import make_env
+
+from rllib.robust_actions import actions_to_tensor_per_env, actions_to_tensor_vectorized, sample_failed_agents
+
+NUM_ENVS = 16
+N_AGENTS = 4
+
+
+def make_transport_env():
+    return make_env(
+        scenario="transport",
+        num_envs=NUM_ENVS,
+        device="cpu",
+        continuous_actions=True,
+        max_steps=10,
+        seed=0,
+        n_agents=N_AGENTS,
+    )
+
+
+def random_actions(rng, env):
+    action_size = env.get_agent_action_size(env.agents[0])
+    return list(rng.uniform(-1, 1, (NUM_ENVS, N_AGENTS, action_size)).astype(np.float32))
+
+
+def test_same_mask_gives_same_actions():
+    env = make_transport_env()
+    rng = np.random.default_rng(0)
+    failed_agents = torch.from_numpy(rng.random((NUM_ENVS, N_AGENTS)) < 0.3)
+
+    actions = random_actions(rng, env)
+    vectorized = actions_to_tensor_vectorized(actions, env, failed_agents)
+    reference = actions_to_tensor_per_env(actions, env, failed_agents)
+
+    assert failed_agents.any()
+    assert len(vectorized) == len(reference) == N_AGENTS
+    for vectorized_actions, reference_actions in zip(vectorized, reference):
+        assert torch.equal(vectorized_actions, reference_actions)
+
+
+def test_same_seed_gives_same_actions():
+    env = make_transport_env()
+    conversions = [actions_to_tensor_vectorized, actions_to_tensor_per_env]
+    failed_agents = [torch.zeros(NUM_ENVS, N_AGENTS, dtype=torch.bool) for _ in conversions]
+    rngs = [np.random.default_rng(1) for _ in conversions]
+    generator_states = [torch.manual_seed(2).get_state() for _ in conversions]
+
+    for _ in range(5):
+        step_actions = []
+        for i, conversion in enumerate(conversions):
+            # Both paths sample their failures from the same random stream, as VectorEnvWrapperRobust does
+            torch.random.set_rng_state(generator_states[i])
+            sample_failed_agents(failed_agents[i], k_robustness=2, failure_probability_per_step=0.5)
+            generator_states[i] = torch.random.get_rng_state()
+            step_actions.append(conversion(random_actions(rngs[i], env), env, failed_agents[i]))
+
+        assert torch.equal(failed_agents[0], failed_agents[1])
+        for vectorized_actions, reference_actions in zip(*step_actions):
+            assert torch.equal(vectorized_actions, reference_actions)
+    assert failed_agents[0].any()